@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""
+Benchmark the ranking pipeline with synthetic channels and CSV files.
+
+Usage:
+python3 benchmark.py [--sizes 10000,100000,1000000] [--output results.json]
+
+Every function and size runs in its own process with a time budget,
+larger sizes of a function are skipped after a timeout.
+Results are printed or written as JSON to compare releases.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import asyncio
+import logging
+import tempfile
+import platform
+import subprocess
+import contextlib
+import functools
+from argparse import ArgumentParser, SUPPRESS
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+CHAT_ID = -1001234567890
+CONTEST_DATE = "2024-06-30 23:59:59"
+
+# functions to benchmark in this order
+FUNCTIONS = [
+    "get_participants",
+    "check_participant_duplicates",
+    "get_participants_from_csv",
+    "get_daily_winners",
+    "create_ranking",
+    "get_inactivities_from_csv",
+    "create_hashtaglist"
+]
+
+CONFIG_TEMPLATE = '''
+CHAT_ID = {chat_id}
+CONTEST_DATE = "{contest_date}"
+CONTEST_DAYS = {days}
+CONTEST_MAX_RANKS = 10
+CSV_FILE = "{csv_file}"
+PARTICIPANTS_FROM_CSV = True
+FINAL_MESSAGE_CHAT_ID = False
+CREATE_CSV = False
+RANK_MEMES = True
+'''
+
+def get_args():
+    '''parse benchmark arguments'''
+    parser = ArgumentParser(description="Benchmark the ranking pipeline")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma separated amount of posts per synthetic channel")
+    parser.add_argument("--functions", default=",".join(FUNCTIONS),
+                        help="comma separated functions to benchmark")
+    parser.add_argument("--days", type=int, default=31,
+                        help="days of synthetic history, used as CONTEST_DAYS")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--max-seconds", type=float, default=120,
+                        help="time budget for a single function and size")
+    parser.add_argument("--output", metavar="FILE", help="write JSON results to file")
+    parser.add_argument("--workdir", help="directory for synthetic data")
+    parser.add_argument("--run-case", help=SUPPRESS)
+    parser.add_argument("--posts", type=int, help=SUPPRESS)
+
+    # ignore config arguments for memecontestbot
+    args, _unknown = parser.parse_known_args()
+    return args
+
+def generate_posts(count, days, seed):
+    '''Return synthetic posts with long tail author and reaction distributions'''
+    rnd = random.Random(seed)
+    contest_time = datetime.strptime(CONTEST_DATE, "%Y-%m-%d %H:%M:%S")
+    step = days * 86400 / count
+
+    # few authors post a lot, most authors post rarely
+    author_count = max(10, count // 20)
+    cum_weights = []
+    total = 0
+    for rank in range(1, author_count + 1):
+        total += 1 / (rank ** 1.1)
+        cum_weights.append(total)
+    authors = rnd.choices(range(author_count), cum_weights=cum_weights, k=count)
+
+    posts = []
+    for i in range(count):
+        reactions = int(rnd.lognormvariate(2.0, 1.0))
+        posts.append({
+            "id": i + 1,
+            "author": f"user{authors[i]}",
+            "date": contest_time - timedelta(seconds=int((count - i - 1) * step)),
+            "count": reactions,
+            "views": reactions * rnd.randint(10, 40) + rnd.randint(50, 500),
+            "hashtag": f"#tag{int(rnd.paretovariate(1.2))}"
+        })
+
+    return posts
+
+def post_to_message(post):
+    '''Return a message object like message_store rows'''
+    reactions = None
+    if post["count"]:
+        reactions = SimpleNamespace(reactions=[
+            SimpleNamespace(emoji="👍", count=post["count"])
+        ])
+
+    return SimpleNamespace(
+        id=post["id"],
+        empty=False,
+        chat=SimpleNamespace(id=CHAT_ID),
+        date=post["date"],
+        media="MessageMediaType.PHOTO",
+        caption=f"Meme by @{post['author']} {post['hashtag']}",
+        text=None,
+        entities=None,
+        caption_entities=None,
+        photo=SimpleNamespace(
+            file_id=f"photo{post['id']}",
+            file_unique_id=f"unique{post['id']}"
+        ),
+        reactions=reactions,
+        views=post["views"],
+        from_user=None,
+        author_signature=None,
+        media_group_id=None,
+        reply_to_message_id=None,
+        forward_from_message_id=None,
+        poll=None
+    )
+
+class SyntheticClient:
+    """Fake chat history iterator over synthetic posts"""
+
+    def __init__(self, posts):
+        self.posts = posts
+
+    async def get_chat_history(self, _chat_id, limit = 0, offset = 0,
+            offset_id = 0, offset_date = None):
+        """yield synthetic messages from newest to oldest"""
+        yielded = 0
+        for post in reversed(self.posts):
+            if offset_id and post["id"] >= offset_id:
+                continue
+            if offset_date and post["date"] >= offset_date:
+                continue
+            if offset > 0:
+                offset -= 1
+                continue
+            yield post_to_message(post)
+            yielded += 1
+            if limit and yielded >= limit:
+                return
+
+    async def search_messages(self, chat_id, **_kwargs):
+        """all synthetic messages are photos"""
+        async for message in self.get_chat_history(chat_id):
+            yield message
+
+def write_csv(path, posts):
+    '''Write synthetic posts in contest CSV schema'''
+    with open(path, mode='w', encoding="utf-8") as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow([
+            'Username', 'Postlink', 'Timestamp', 'Count', 'Views', 'Mode', 'Unique ID'
+        ])
+        for post in posts:
+            csvwriter.writerow([
+                post["author"],
+                f"https://t.me/c/{str(CHAT_ID).replace('-100', '')}/{post['id']}",
+                str(post["date"]),
+                post["count"],
+                post["views"],
+                1,
+                f"unique{post['id']}"
+            ])
+
+def prepare_workdir(workdir, size, days, seed):
+    '''Write synthetic CSV and config for a size, return config path'''
+    os.makedirs(workdir, exist_ok=True)
+    csv_file = os.path.join(workdir, f"contest_{size}.csv")
+    if not os.path.isfile(csv_file):
+        logging.info("Generate %d synthetic posts in %s", size, csv_file)
+        write_csv(csv_file, generate_posts(size, days, seed))
+
+    config_file = os.path.join(workdir, f"bench_config_{size}.py")
+    with open(config_file, mode='w', encoding="utf-8") as configfile:
+        configfile.write(CONFIG_TEMPLATE.format(
+            chat_id=CHAT_ID,
+            contest_date=CONTEST_DATE,
+            days=days,
+            csv_file=csv_file.replace("\\", "/")
+        ))
+
+    return config_file
+
+def run_case(args):
+    '''Run a single benchmark case in this process and return seconds'''
+    # memecontestbot loads the config given by -c on import
+    import memecontestbot # pylint: disable=import-outside-toplevel
+
+    logging.disable(logging.CRITICAL)
+    posts = generate_posts(args.posts, args.days, args.seed)
+    memecontestbot.app = SyntheticClient(posts)
+    function = args.run_case
+
+    if function == "get_participants":
+        call = functools.partial(memecontestbot.get_participants, args.days)
+    elif function == "check_participant_duplicates":
+        messages = [post_to_message(post) for post in reversed(posts)]
+        call = functools.partial(check_duplicates, memecontestbot, messages)
+    elif function == "get_participants_from_csv":
+        call = functools.partial(memecontestbot.get_participants_from_csv, args.days)
+    elif function == "get_daily_winners":
+        call = memecontestbot.get_daily_winners
+    elif function == "create_ranking":
+        participants = [
+            memecontestbot.create_participant(post_to_message(post), post["author"])
+            for post in posts
+        ]
+        call = functools.partial(memecontestbot.create_ranking, participants)
+    elif function == "get_inactivities_from_csv":
+        call = memecontestbot.get_inactivities_from_csv
+    elif function == "create_hashtaglist":
+        call = memecontestbot.create_hashtaglist
+    else:
+        raise ValueError(f"Unknown function {function}")
+
+    with open(os.devnull, mode='w', encoding="utf-8") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = call()
+            if asyncio.iscoroutine(result):
+                asyncio.run(result)
+            seconds = time.perf_counter() - start
+
+    return seconds
+
+async def check_duplicates(memecontestbot, messages):
+    '''Walk messages like the participant collector'''
+    participants = []
+    author_index = {}
+    for message in messages:
+        author = memecontestbot.get_author(message)
+        participants, duplicate = memecontestbot.check_participant_duplicates(
+            participants, message, author, author_index
+        )
+        if not duplicate:
+            participant = memecontestbot.create_participant(message, author)
+            participants.append(participant)
+            author_index.setdefault(author.lower(), participant)
+
+def start_case(args, workdir, function, size):
+    '''Run a benchmark case in a subprocess with time budget'''
+    config_file = prepare_workdir(workdir, size, args.days, args.seed)
+    result = {"function": function, "posts": size, "seconds": None, "status": "ok"}
+
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "-c", os.path.basename(config_file),
+        "--run-case", function,
+        "--posts", str(size),
+        "--days", str(args.days),
+        "--seed", str(args.seed)
+    ]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True,
+            timeout=args.max_seconds, cwd=workdir)
+        result["seconds"] = round(json.loads(output.stdout.splitlines()[-1])["seconds"], 6)
+    except subprocess.TimeoutExpired:
+        result["status"] = "timeout"
+    except subprocess.CalledProcessError as ex_process:
+        result["status"] = "error"
+        logging.error("%s with %d posts failed:\n%s", function, size, ex_process.stderr)
+
+    logging.info("%s with %d posts: %s %s",
+        function, size, result["status"], result["seconds"])
+    return result
+
+def main():
+    '''Run all benchmark cases and report JSON'''
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+    args = get_args()
+
+    if args.run_case:
+        # child process: print the measured seconds only
+        print(json.dumps({"seconds": run_case(args)}))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    functions = args.functions.split(",")
+    results = []
+
+    with contextlib.ExitStack() as stack:
+        workdir = os.path.abspath(args.workdir) if args.workdir else None
+        if not workdir:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory())
+
+        for function in functions:
+            skip = False
+            for size in sizes:
+                if skip:
+                    results.append({"function": function, "posts": size,
+                        "seconds": None, "status": "skipped"})
+                    continue
+                result = start_case(args, workdir, function, size)
+                results.append(result)
+                skip = result["status"] != "ok"
+
+    report = {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "days": args.days,
+        "seed": args.seed,
+        "max_seconds": args.max_seconds,
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, mode='w', encoding="utf-8") as outputfile:
+            json.dump(report, outputfile, indent=2)
+        logging.info("Results saved as %s", args.output)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
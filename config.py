@@ -40,6 +40,34 @@ CONTEST_POLL_RESULT = False
 # False for random colors or RGB, set as array [212, 175, 55]
 CONTEST_POLL_COLOR = [212, 175, 55]
 
+# Download winner photos for a poll concurrently
+# Amount of parallel downloads (Default: 4)
+CONTEST_POLL_DOWNLOADS = 4
+
+# Render numbered photos in parallel worker processes
+# Amount of processes or 0 to render in a thread (Default: 4)
+CONTEST_POLL_WORKERS = 4
+
+# Retry failed media downloads for x seconds in total
+# Winners without media are skipped (Default: 300)
+DOWNLOAD_MEDIA_BUDGET = 300
+
+# Limit outbound messages per second to one chat and to all chats,
+# 0 sends without limit (Default: 0), FloodWait is always waited and retried.
+# The collector sends all photos to one chat, i.e. 1 sends one photo per second
+SEND_CHAT_RATE = 0
+SEND_GLOBAL_RATE = 0
+
+# Amount of outbound calls in flight at once (Default: 4)
+SEND_CONCURRENCY = 4
+
+# Keep downloaded and numbered poll photos in a local cache
+# False or path to directory (i.e. "media_cache")
+MEDIA_CACHE = False
+
+# Remove least recently used media above x megabytes (Default: 500)
+MEDIA_CACHE_SIZE = 500
+
 # Poll result mode: Pattern to find the last open poll to evaluate
 # Poll create mode: Pattern used with CONTEST_POLL_FROM_POLLS
 # to find recent poll results and create a new poll
@@ -50,6 +78,16 @@ CONTEST_POLL_PATTERN = ["Meme of the week"]
 # False or postlink (https://t.me/c/{chat_id}/{message_id})
 CONTEST_HIGHSCORE = False
 
+# Text of the link to the next highscore message
+# Long highscores are continued in new messages in the highscore chat
+CONTEST_HIGHSCORE_NEXT = "➡️ More"
+
+# Keep the highscore medals in a local ledger file,
+# created from the highscore message on first use.
+# The message is only edited if the rendered highscore has changed
+# False or path to file (i.e. "highscore.json")
+CONTEST_HIGHSCORE_LEDGER = False
+
 # posts we want to exclude from ranking.
 # Add your patterns to this array.
 EXCLUDE_PATTERN = ["Meme Contest", "Ranking"]
@@ -123,5 +161,31 @@ POST_PARTICIPANTS_CHAT_ID = False
 # Format date
 DATE_FORMATTING = "%d.%m.%Y"
 
+# Keep photo and poll messages in a local SQLite file
+# and only fetch new messages on each run
+# False or path to file (i.e. "messages.sqlite")
+MESSAGE_STORE = False
+
+# Refresh reactions and views of stored messages
+# younger than x days when they were synced
+MESSAGE_STORE_SETTLE_DAYS = 7
+
+# Let telegram search for photo messages only
+# instead of walking through the full chat history,
+# the search always starts at the newest message,
+# for a CONTEST_DATE far in the past the chat history is walked from there
+# True or False (Default: False)
+SCAN_MEDIA_FILTER = False
+
+# Keep unique photo ids of CSV_FILE in a SQLite index file
+# to check reposts without reading the full CSV on each run
+# True (CSV_FILE + ".index"), False or path to file (Default: False)
+CSV_INDEX = False
+
+# Keep CSV_FILE data in a compact binary columns file,
+# CSV modes read it instead of parsing the CSV
+# False or path to file (i.e. "contest.columns")
+CONTEST_COLUMNS_FILE = False
+
 # END TWEAK CONFIG
 #########################
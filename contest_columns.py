@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""
+Compact columnar storage for contest CSV data.
+Timestamps, counts and views are typed columns,
+authors and postlink prefixes are interned tables.
+New rows are appended to the file as segments.
+
+Usage:
+python3 contest_columns.py import contest.csv contest.columns
+python3 contest_columns.py export contest.columns contest.csv
+"""
+
+import os
+import sys
+import csv
+import json
+import struct
+import logging
+from array import array
+from argparse import ArgumentParser
+
+# own modules
+import timestamps
+
+MAGIC = b"MCBC"
+FORMAT_VERSION = 2
+
+# single segment files of version 1 are still readable
+READ_VERSIONS = (1, 2)
+
+CSV_FIELDS = ['Username', 'Postlink', 'Timestamp', 'Count', 'Views', 'Mode', 'Unique ID']
+
+# numeric columns and their array typecodes
+COLUMNS = {
+    "timestamps": "q",
+    "counts": "q",
+    "views": "q",
+    "modes": "q",
+    "authors": "q",
+    "prefixes": "q",
+    "message_ids": "q"
+}
+
+class ContestColumns:
+    """Contest rows as typed columns with interned strings"""
+
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        self.author_names = []
+        self.prefix_names = []
+        self.unique_ids = []
+        # size of the CSV file these rows were read from
+        self.csv_size = 0
+        # table indexes of interned names
+        self.lookups = {"authors": {}, "prefixes": {}}
+        # rows and names already written to the columns file
+        self.saved = {"rows": 0, "author_names": 0, "prefix_names": 0}
+
+    def __len__(self):
+        return len(self.columns["timestamps"])
+
+    def intern(self, names, lookup, name):
+        """Return table index of name, add it if new"""
+        index = lookup.get(name)
+        if index is None:
+            index = len(names)
+            names.append(name)
+            lookup[name] = index
+        return index
+
+    def append(self, row):
+        """Add a row in CSV schema, Timestamp as naive datetime"""
+        # split postlink into interned chat prefix and message id
+        prefix, _separator, message_id = row['Postlink'].rpartition("/")
+        if prefix and message_id.isdigit() and str(int(message_id)) == message_id:
+            prefix += "/"
+            message_id = int(message_id)
+        else:
+            prefix = row['Postlink']
+            message_id = -1
+
+        mode = str(row.get('Mode') or 0)
+        self.columns["timestamps"].append(timestamps.to_timestamp(row['Timestamp']))
+        self.columns["counts"].append(int(row['Count']))
+        self.columns["views"].append(int(row['Views']))
+        self.columns["modes"].append(int(mode) if mode.lstrip("-").isdigit() else 0)
+        self.columns["authors"].append(
+            self.intern(self.author_names, self.lookups["authors"], row['Username']))
+        self.columns["prefixes"].append(
+            self.intern(self.prefix_names, self.lookups["prefixes"], prefix))
+        self.columns["message_ids"].append(message_id)
+        self.unique_ids.append(row.get('Unique ID') or "")
+
+    def author(self, i):
+        """Return author of row i"""
+        return self.author_names[self.columns["authors"][i]]
+
+    def postlink(self, i):
+        """Return postlink of row i"""
+        prefix = self.prefix_names[self.columns["prefixes"][i]]
+        message_id = self.columns["message_ids"][i]
+        if message_id < 0:
+            return prefix
+        return f"{prefix}{message_id}"
+
+    def row(self, i):
+        """Return row i in CSV schema with typed values"""
+        return {
+            'Username': self.author(i),
+            'Postlink': self.postlink(i),
+            'Timestamp': timestamps.from_timestamp(self.columns["timestamps"][i]),
+            'Count': self.columns["counts"][i],
+            'Views': self.columns["views"][i],
+            'Mode': self.columns["modes"][i],
+            'Unique ID': self.unique_ids[i]
+        }
+
+    def select(self, start, end):
+        """Return row numbers newer than start and not newer than end, in file order"""
+        start = timestamps.to_timestamp(start)
+        end = timestamps.to_timestamp(end)
+        return [
+            i for i, timestamp in enumerate(self.columns["timestamps"])
+            if start < timestamp <= end
+        ]
+
+def read_segment(columns_file, data):
+    """Read the next segment into data, return False at the end of the file"""
+    size_data = columns_file.read(4)
+    if len(size_data) < 4:
+        return False
+
+    header_size = struct.unpack("<I", size_data)[0]
+    header_data = columns_file.read(header_size)
+    if len(header_data) < header_size:
+        return False
+    header = json.loads(header_data.decode("utf-8"))
+    if header["version"] not in READ_VERSIONS:
+        raise ValueError(f"Unknown contest columns version {header['version']}")
+
+    columns = {}
+    for name, typecode in COLUMNS.items():
+        column = array(typecode)
+        column_data = columns_file.read(header["rows"] * column.itemsize)
+        if len(column_data) < header["rows"] * column.itemsize:
+            # incomplete segment of an interrupted append
+            return False
+        column.frombytes(column_data)
+        if sys.byteorder != "little":
+            column.byteswap()
+        columns[name] = column
+
+    for name, column in columns.items():
+        data.columns[name].extend(column)
+    data.author_names += header["author_names"]
+    data.prefix_names += header["prefix_names"]
+    data.unique_ids += header["unique_ids"]
+    data.csv_size = header["csv_size"]
+
+    return True
+
+def load(path):
+    """Read contest columns from file"""
+    data = ContestColumns()
+    with open(path, mode="rb") as columns_file:
+        if columns_file.read(4) != MAGIC:
+            raise ValueError(f"{path} is not a contest columns file")
+
+        while read_segment(columns_file, data):
+            pass
+
+    data.lookups = {
+        "authors": {name: i for i, name in enumerate(data.author_names)},
+        "prefixes": {name: i for i, name in enumerate(data.prefix_names)}
+    }
+    data.saved = {
+        "rows": len(data),
+        "author_names": len(data.author_names),
+        "prefix_names": len(data.prefix_names)
+    }
+
+    return data
+
+def write_segment(columns_file, data):
+    """Write rows and names added since the last write as a segment"""
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "rows": len(data) - data.saved["rows"],
+        "csv_size": data.csv_size,
+        "author_names": data.author_names[data.saved["author_names"]:],
+        "prefix_names": data.prefix_names[data.saved["prefix_names"]:],
+        "unique_ids": data.unique_ids[data.saved["rows"]:]
+    }, separators=(",", ":")).encode("utf-8")
+
+    columns_file.write(struct.pack("<I", len(header)))
+    columns_file.write(header)
+    for name in COLUMNS:
+        column = data.columns[name][data.saved["rows"]:]
+        if sys.byteorder != "little":
+            column.byteswap()
+        columns_file.write(column.tobytes())
+
+    data.saved = {
+        "rows": len(data),
+        "author_names": len(data.author_names),
+        "prefix_names": len(data.prefix_names)
+    }
+
+def save(data, path):
+    """Write contest columns to file, replace it atomically"""
+    data.saved = {"rows": 0, "author_names": 0, "prefix_names": 0}
+
+    temp_path = path + ".tmp"
+    with open(temp_path, mode="wb") as columns_file:
+        columns_file.write(MAGIC)
+        write_segment(columns_file, data)
+
+    os.replace(temp_path, path)
+
+def append(data, path):
+    """Append rows added since load or save to the columns file"""
+    if not os.path.isfile(path) or data.saved["rows"] == 0:
+        save(data, path)
+        return
+
+    with open(path, mode="ab") as columns_file:
+        write_segment(columns_file, data)
+
+def import_csv(csv_file):
+    """Return contest columns read from a contest CSV file"""
+    data = ContestColumns()
+    with open(csv_file, mode='r', encoding="utf-8") as csvfile:
+        for row in csv.DictReader(csvfile):
+            row['Timestamp'] = timestamps.parse_datetime(row['Timestamp'])
+            data.append(row)
+    data.csv_size = os.path.getsize(csv_file)
+
+    return data
+
+def export_csv(data, csv_file):
+    """Write contest columns as contest CSV file"""
+    with open(csv_file, mode='w', encoding="utf-8") as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(CSV_FIELDS)
+        for i in range(len(data)):
+            row = data.row(i)
+            row['Timestamp'] = str(row['Timestamp'])
+            csvwriter.writerow([row[field] for field in CSV_FIELDS])
+
+def main():
+    """Convert between contest CSV and columns files"""
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+    parser = ArgumentParser(description="Convert contest CSV and columns files")
+    parser.add_argument("command", choices=["import", "export"],
+                        help="import CSV to columns or export columns to CSV")
+    parser.add_argument("source", help="file to read")
+    parser.add_argument("target", help="file to write")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        data = import_csv(args.source)
+        save(data, args.target)
+    else:
+        data = load(args.source)
+        export_csv(data, args.target)
+
+    logging.info("%s %d rows from %s to %s", args.command.capitalize(),
+        len(data), args.source, args.target)
+
+if __name__ == "__main__":
+    main()
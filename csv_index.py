@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+Persistent SQLite sidecar index for the contest CSV file.
+Maps photo unique ids to their first postlink for repost checks
+and blocks of rows to byte ranges and timestamp ranges,
+so readers can seek into the contest window.
+Only rows appended after the last indexed byte are read on update.
+"""
+
+import io
+import os
+import csv
+import mmap
+import logging
+import sqlite3
+
+# own modules
+import timestamps
+
+# rows per timestamp block
+BLOCK_ROWS = 512
+
+# rebuild index files of older versions
+INDEX_VERSION = 2
+
+def get_index_path(csv_file, index_file = True):
+    """Return the index path, next to the CSV file by default"""
+    if index_file is True:
+        return csv_file + ".index"
+    return index_file
+
+def open_index(path):
+    """Open or create the CSV index"""
+    index = sqlite3.connect(path)
+    index.execute(
+        "CREATE TABLE IF NOT EXISTS reposts ("
+        "unique_id TEXT PRIMARY KEY, postlink TEXT)"
+    )
+    index.execute(
+        "CREATE TABLE IF NOT EXISTS blocks ("
+        "offset INTEGER PRIMARY KEY, end INTEGER, rows INTEGER, "
+        "min_date INTEGER, max_date INTEGER)"
+    )
+    index.execute(
+        "CREATE TABLE IF NOT EXISTS csv_state ("
+        "id INTEGER PRIMARY KEY CHECK (id = 0), header TEXT, size INTEGER)"
+    )
+
+    if index.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+        clear_index(index)
+        index.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        index.commit()
+
+    return index
+
+def get_state(index):
+    """Return indexed CSV header and byte size"""
+    row = index.execute("SELECT header, size FROM csv_state WHERE id = 0").fetchone()
+    if not row:
+        return None, 0
+    return row[0], row[1]
+
+def set_state(index, header, size):
+    """Remember indexed CSV header and byte size"""
+    index.execute(
+        "INSERT OR REPLACE INTO csv_state (id, header, size) VALUES (0, ?, ?)",
+        (header, size)
+    )
+
+def clear_index(index):
+    """Drop all indexed rows"""
+    index.execute("DELETE FROM reposts")
+    index.execute("DELETE FROM blocks")
+    set_state(index, None, 0)
+
+def read_header(csv_file):
+    """Return the first line of the CSV file"""
+    with open(csv_file, mode='rb') as csvfile:
+        return csvfile.readline().decode("utf-8").rstrip("\r\n")
+
+def split_rows(data, offset):
+    """Yield byte offset, end and text of each CSV record in data"""
+    start = 0
+    record = b""
+    for line in data.splitlines(keepends=True):
+        record += line
+        # a quoted field may contain line breaks
+        if record.count(b'"') % 2:
+            continue
+        end = start + len(record)
+        yield offset + start, offset + end, record.decode("utf-8")
+        start = end
+        record = b""
+
+def add_blocks(index, records, fields):
+    """Index timestamp blocks of (offset, end, text) records"""
+    if "Timestamp" not in fields:
+        return
+
+    timestamp_field = fields.index("Timestamp")
+    blocks = []
+    for offset, end, text in records:
+        row = next(csv.reader([text]), None)
+        if not row or len(row) <= timestamp_field:
+            continue
+        try:
+            timestamp = timestamps.to_timestamp(
+                timestamps.parse_datetime(row[timestamp_field]))
+        except ValueError:
+            logging.warning("CSV index: skip row with invalid timestamp at byte %d", offset)
+            continue
+
+        if not blocks or blocks[-1][2] >= BLOCK_ROWS:
+            blocks.append([offset, end, 0, timestamp, timestamp])
+        block = blocks[-1]
+        block[1] = end
+        block[2] += 1
+        block[3] = min(block[3], timestamp)
+        block[4] = max(block[4], timestamp)
+
+    index.executemany(
+        "INSERT OR REPLACE INTO blocks (offset, end, rows, min_date, max_date) "
+        "VALUES (?, ?, ?, ?, ?)", blocks
+    )
+
+def update_index(index, csv_file):
+    """Index CSV rows appended since the last update, return new row count"""
+    if not os.path.isfile(csv_file):
+        clear_index(index)
+        index.commit()
+        return 0
+
+    header = read_header(csv_file)
+    indexed_header, indexed_size = get_state(index)
+
+    # rebuild if the CSV was replaced or truncated
+    if (indexed_header is not None and indexed_header != header
+            or os.path.getsize(csv_file) < indexed_size):
+        logging.info("CSV index is outdated, rebuild from %s", csv_file)
+        clear_index(index)
+        indexed_size = 0
+
+    with open(csv_file, mode='rb') as csvfile:
+        csvfile.seek(indexed_size)
+        data = csvfile.read()
+
+    # only index complete lines, a partial row is read next time
+    data = data[:data.rfind(b"\n") + 1]
+    if not data:
+        return 0
+
+    fields = next(csv.reader([header]))
+    records = list(split_rows(data, indexed_size))
+    if indexed_size == 0:
+        # skip header
+        records = records[1:]
+    add_blocks(index, records, fields)
+
+    if "Unique ID" not in fields or "Postlink" not in fields:
+        logging.info("Unique ID is missing in CSV. Skip repost check!")
+        set_state(index, header, indexed_size + len(data))
+        index.commit()
+        return 0
+
+    csv_dict = csv.DictReader(io.StringIO(data.decode("utf-8"), newline=""), fieldnames=fields)
+
+    rows = []
+    for row in csv_dict:
+        if indexed_size == 0 and csv_dict.line_num == 1:
+            # skip header
+            continue
+        if row['Unique ID']:
+            rows.append((row['Unique ID'], row['Postlink']))
+
+    # keep the first postlink of a unique id
+    index.executemany(
+        "INSERT OR IGNORE INTO reposts (unique_id, postlink) VALUES (?, ?)", rows
+    )
+    set_state(index, header, indexed_size + len(data))
+    index.commit()
+
+    return len(rows)
+
+def count_rows(index):
+    """Return the count of indexed CSV rows"""
+    return index.execute("SELECT COALESCE(SUM(rows), 0) FROM blocks").fetchone()[0]
+
+def read_rows(index, csv_file, start, end):
+    """
+    Return CSV rows as dicts from blocks with timestamps
+    newer than start and not newer than end, in file order.
+    Rows outside of the timeframe are included and must be checked.
+    """
+    blocks = index.execute(
+        "SELECT offset, end FROM blocks WHERE max_date > ? AND min_date <= ? "
+        "ORDER BY offset",
+        (timestamps.to_timestamp(start), timestamps.to_timestamp(end))
+    ).fetchall()
+    if not blocks:
+        return []
+
+    fields = next(csv.reader([read_header(csv_file)]))
+    rows = []
+    with open(csv_file, mode='rb') as csvfile:
+        with mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as csvmap:
+            for offset, block_end in blocks:
+                text = csvmap[offset:block_end].decode("utf-8")
+                rows.extend(csv.DictReader(io.StringIO(text, newline=""), fieldnames=fields))
+
+    return rows
+
+def find_postlink(index, unique_id):
+    """Return the first postlink of a unique id or None"""
+    row = index.execute(
+        "SELECT postlink FROM reposts WHERE unique_id = ?", (unique_id,)
+    ).fetchone()
+    if not row:
+        return None
+    return row[0]
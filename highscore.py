@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+"""
+Structured highscore model.
+The highscore text is parsed into lines, rank lines are entries
+with name and medal count, indexed by lowercase name.
+Only the medal counter of a changed entry is rewritten,
+all other text is kept as it was.
+Entity offsets are counted in UTF-16 code units like in Telegram.
+Long highscores are split into several messages,
+each message links to the next one with a continuation link.
+The model can be kept in a local JSON ledger.
+"""
+
+import os
+import re
+import copy
+import json
+
+from pyrogram import types, enums
+
+# Telegram length limits of message text and photo captions
+MESSAGE_LENGTH = 4096
+CAPTION_LENGTH = 1024
+
+LEDGER_VERSION = 2
+
+def utf16_len(text):
+    """Return the length of text in UTF-16 code units"""
+    return len(text.encode("utf-16-le")) // 2
+
+def get_rank_pattern(suffix):
+    """Return the regex of a rank line like '#1  @name 2x🏅'"""
+    return re.compile(
+        r"^(?P<prefix>\D?)(?P<rank>\d+)(?P<gap>\.?\s+)(?P<name>\S.*?)"
+        rf"(?:\s*(?P<medal>(?:(?P<medals>\d+)x)?{re.escape(suffix)}).*)?$"
+    )
+
+def move_entity(entity, offset):
+    """Return a copy of the entity at a new offset"""
+    entity = copy.copy(entity)
+    entity.offset = offset
+    return entity
+
+def find_next_link(text, entities, label):
+    """Return the url of the continuation link at the end of text or None"""
+    if not text.rstrip().endswith(label):
+        return None
+
+    label_offset = utf16_len(text.rstrip()) - utf16_len(label)
+    for entity in entities:
+        if entity.offset == label_offset and getattr(entity, "url", None):
+            return entity.url
+    return None
+
+def remove_next_link(text, entities, label):
+    """Return text and entities without the continuation link"""
+    if find_next_link(text, entities, label) is None:
+        return text, entities
+
+    text = text.rstrip()[:-len(label)].rstrip()
+    length = utf16_len(text)
+    return text, [entity for entity in entities if entity.offset < length]
+
+def add_next_link(text, entities, label, url):
+    """Return text and entities with a continuation link to url"""
+    text = f"{text}\n\n{label}"
+    link = types.MessageEntity(
+        type=enums.MessageEntityType.TEXT_LINK,
+        offset=utf16_len(text) - utf16_len(label),
+        length=utf16_len(label),
+        url=url
+    )
+    return text, list(entities) + [link]
+
+class Highscore:
+    """Highscore as lines, rank lines are entries indexed by name"""
+
+    def __init__(self, suffix):
+        self.suffix = suffix
+        # dicts with text and entities relative to the line,
+        # entries also have name, rank, medals and the medal position
+        self.lines = []
+        self.index = {}
+
+    def add_line(self, line, position = None):
+        """Add a line at position or at the end, index entries by name"""
+        if position is None:
+            self.lines.append(line)
+        else:
+            self.lines.insert(position, line)
+
+        if "name" in line:
+            name = line["name"].lower()
+            self.index.setdefault(name, line)
+            # also find entries like '@name (title)' by their first word
+            self.index.setdefault(name.split(" ")[0], line)
+
+    def entries(self):
+        """Return entry lines in order"""
+        return [line for line in self.lines if "name" in line]
+
+    def find(self, name):
+        """Return the entry of name or None"""
+        return self.index.get(name.lower())
+
+    def add_medal(self, name):
+        """Add a medal to name, insert a new entry after the last one if name is missing"""
+        entry = self.find(name)
+        if entry is not None:
+            self.set_medals(entry, entry["medals"] + 1)
+            return entry
+
+        entries = self.entries()
+        # continue the last entry in its style
+        prefix, rank, gap = ("", 1, "  ")
+        if entries:
+            last = entries[-1]
+            prefix, rank, gap = (last["prefix"], last["rank"] + 1, last["gap"])
+        line = f"{prefix}{rank}{gap}{name} "
+        medal = f"1x{self.suffix}"
+        entry = {
+            "text": line + medal,
+            "entities": [],
+            "prefix": prefix,
+            "rank": rank,
+            "gap": gap,
+            "name": name,
+            "medals": 1,
+            "medal_start": len(line),
+            "medal_end": len(line + medal)
+        }
+
+        if entries:
+            position = self.lines.index(entries[-1]) + 1
+        else:
+            # start a new list after the text
+            if self.lines and self.lines[-1]["text"]:
+                self.add_line({"text": "", "entities": []})
+            position = len(self.lines)
+        self.add_line(entry, position)
+
+        return entry
+
+    def set_medals(self, entry, medals):
+        """Rewrite the medal counter of an entry, keep the rest of the line"""
+        text = entry["text"]
+        medal = f"{medals}x{self.suffix}"
+        if entry["medal_start"] < 0:
+            # first medal, just append
+            separator = "" if text.endswith(" ") else " "
+            entry["medal_start"] = len(text) + len(separator)
+            entry["medal_end"] = entry["medal_start"]
+            text += separator
+
+        start = entry["medal_start"]
+        end = entry["medal_end"]
+        shift = utf16_len(medal) - utf16_len(text[start:end])
+        end_offset = utf16_len(text[:end])
+        entry["entities"] = [
+            move_entity(entity, entity.offset + shift)
+            if entity.offset >= end_offset else entity
+            for entity in entry["entities"]
+        ]
+        entry["text"] = text[:start] + medal + text[end:]
+        entry["medal_end"] = start + len(medal)
+        entry["medals"] = medals
+
+    def render(self):
+        """Return highscore text and entities"""
+        return self.render_page(self.lines)
+
+    def render_page(self, lines):
+        """Return text and entities of lines"""
+        entities = []
+        offset = 0
+        for line in lines:
+            entities += [
+                move_entity(entity, offset + entity.offset)
+                for entity in line["entities"]
+            ]
+            offset += utf16_len(line["text"]) + 1
+
+        return "\n".join(line["text"] for line in lines), entities
+
+    def split(self, limits, label):
+        """
+        Return pages of text and entities, page i fits limits[i]
+        or MESSAGE_LENGTH, all pages but the last need a continuation link
+        """
+        def limit(page):
+            if page < len(limits):
+                return limits[page]
+            return MESSAGE_LENGTH
+
+        link_length = utf16_len(label) + 2
+        pages = [[]]
+        length = 0
+        for line in self.lines:
+            line_length = utf16_len(line["text"])
+            if pages[-1]:
+                line_length += 1
+                if length + line_length + link_length > limit(len(pages) - 1):
+                    pages.append([])
+                    length = 0
+                    line_length -= 1
+            pages[-1].append(line)
+            length += line_length
+
+        return [self.render_page(page) for page in pages]
+
+def parse(text, entities, suffix):
+    """Return the highscore model of text and entities"""
+    highscore = Highscore(suffix)
+    pattern = get_rank_pattern(suffix)
+
+    starts = []
+    offset = 0
+    for text_line in text.split("\n"):
+        starts.append(offset)
+        offset += utf16_len(text_line) + 1
+
+        line = {"text": text_line, "entities": []}
+        match = pattern.match(text_line)
+        if match:
+            line["prefix"] = match.group("prefix")
+            line["rank"] = int(match.group("rank"))
+            line["gap"] = match.group("gap")
+            line["name"] = match.group("name").strip()
+            if match.group("medal"):
+                line["medals"] = int(match.group("medals") or 1)
+                line["medal_start"] = match.start("medal")
+                line["medal_end"] = match.end("medal")
+            else:
+                line["medals"] = 0
+                line["medal_start"] = -1
+                line["medal_end"] = -1
+        highscore.add_line(line)
+
+    # keep entities relative to their line
+    for entity in entities:
+        i = max(i for i, start in enumerate(starts) if start <= entity.offset)
+        highscore.lines[i]["entities"].append(move_entity(entity, entity.offset - starts[i]))
+
+    return highscore
+
+def parse_pages(pages, label, suffix):
+    """Return the highscore model of several linked pages of text and entities"""
+    text = ""
+    entities = []
+    for i, (page_text, page_entities) in enumerate(pages):
+        page_text, page_entities = remove_next_link(page_text, page_entities, label)
+        if i > 0:
+            text += "\n"
+        offset = utf16_len(text)
+        entities += [move_entity(entity, offset + entity.offset) for entity in page_entities]
+        text += page_text
+
+    return parse(text, entities, suffix)
+
+def entity_to_dict(entity):
+    """Return a storable dict of an entity"""
+    return {
+        "type": str(entity.type).rsplit(".", maxsplit=1)[-1],
+        "offset": entity.offset,
+        "length": entity.length,
+        "url": getattr(entity, "url", None)
+    }
+
+def entity_from_dict(data):
+    """Return an entity from a stored dict"""
+    return types.MessageEntity(
+        type=enums.MessageEntityType[data["type"]],
+        offset=data["offset"],
+        length=data["length"],
+        url=data["url"]
+    )
+
+def load(path, suffix):
+    """Read highscore model and pages from a ledger file"""
+    with open(path, mode="r", encoding="utf-8") as ledger_file:
+        ledger = json.load(ledger_file)
+
+    if ledger["version"] != LEDGER_VERSION:
+        raise ValueError(f"Unknown highscore ledger version {ledger['version']} ({path})")
+
+    highscore = Highscore(suffix)
+    for line in ledger["lines"]:
+        line["entities"] = [entity_from_dict(data) for data in line["entities"]]
+        highscore.add_line(line)
+
+    return highscore, ledger["pages"]
+
+def save(path, highscore, pages):
+    """Write highscore model and pages to a ledger file, replace it atomically"""
+    ledger = {
+        "version": LEDGER_VERSION,
+        "lines": [
+            dict(line, entities=[entity_to_dict(entity) for entity in line["entities"]])
+            for line in highscore.lines
+        ],
+        "pages": pages
+    }
+
+    temp_path = path + ".tmp"
+    with open(temp_path, mode="w", encoding="utf-8") as ledger_file:
+        json.dump(ledger, ledger_file, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+Content addressed disk cache for downloaded and rendered media.
+Entries are files named by the sha256 of their key,
+the least recently used entries are evicted above the size limit once per run.
+"""
+
+import os
+import hashlib
+import logging
+
+def get_path(cache_dir, key):
+    """Return the file path of a cache key"""
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, digest[:2], digest)
+
+def read(cache_dir, key):
+    """Return cached bytes of key or None, mark entry as recently used"""
+    path = get_path(cache_dir, key)
+    try:
+        with open(path, mode="rb") as cache_file:
+            data = cache_file.read()
+    except FileNotFoundError:
+        return None
+
+    os.utime(path)
+    return data
+
+def write(cache_dir, key, data):
+    """Store bytes for key, call evict once after all writes of a run"""
+    path = get_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write to a temporary file first, readers never see partial entries
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, mode="wb") as cache_file:
+        cache_file.write(data)
+    os.replace(temp_path, path)
+
+def evict(cache_dir, max_size):
+    """Remove least recently used entries until the cache fits max_size bytes"""
+    entries = []
+    total_size = 0
+    for root, _dirs, files in os.walk(cache_dir):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+    if total_size <= max_size:
+        return
+
+    entries.sort()
+    for _mtime, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+        logging.debug("Media cache evicted %s", path)
@@ -14,35 +14,78 @@ Check available config variables from settings.py or README.md.
 """
 
 # default imports
+import io
 import os
 import sys
 import logging
 import copy
 import csv
 import re
-import time
 import random
+import heapq
+import functools
+import contextlib
+import multiprocessing
 
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 
 # telegram api
 import asyncio
 from pyrogram import Client, enums
 from pyrogram.types import InputMediaPhoto
-from pyrogram.errors import FloodWait, MessageNotModified
-
-# image manipulation api
-from PIL import Image, ImageDraw, ImageFont
+from pyrogram.errors import FloodWait, MessageNotModified, RPCError
 
 # own modules
 import settings
+import message_store
+import timestamps
+import replay_client
+import csv_index
+import contest_columns
+import poll_images
+import media_cache
+import highscore
+import send_queue
 
 VERSION_NUMBER = "v1.6.8"
 
-config = settings.load_config()
-api = settings.load_api()
+# walk the chat history instead if the media search finds more messages after CONTEST_DATE
+SEARCH_SKIP_LIMIT = 100
+
+def create_client(api_keys):
+    """Return the telegram client, recording or replaying if requested"""
+    if settings.get_file_from_args("replay"):
+        # offline mode: replay a recorded run
+        return replay_client.ReplayClient(settings.get_file_from_args("replay"))
+
+    client = Client("my_account", api_id=api_keys.ID, api_hash=api_keys.HASH)
+    if settings.get_file_from_args("record"):
+        # record all telegram data read by this run
+        return replay_client.RecordingClient(client, settings.get_file_from_args("record"))
+
+    return client
+
+def load_runtime(module_name):
+    """
+    Return config, api keys, client and send queue of this run.
+    Render pool workers import this module as __mp_main__ on spawn platforms,
+    they only render images and get no config and client
+    """
+    if module_name == "__mp_main__":
+        return None, None, None, None
+
+    run_config = settings.load_config()
+    api_keys = settings.load_api()
+    client = create_client(api_keys)
+
+    # all outbound calls are rate limited
+    send_queue_client = send_queue.SendQueue(client, run_config.SEND_CHAT_RATE,
+        run_config.SEND_GLOBAL_RATE, run_config.SEND_CONCURRENCY)
 
-app = Client("my_account", api_id=api.ID, api_hash=api.HASH)
+    return run_config, api_keys, client, send_queue_client
+
+config, api, app, outbound = load_runtime(__name__)
 
 async def main():
     """This function will run the bot"""
@@ -69,7 +112,7 @@ async def main():
 
         if config.PARTICIPANTS_LIST:
             if config.FINAL_MESSAGE_CHAT_ID:
-                await app.send_message(config.FINAL_MESSAGE_CHAT_ID, msg,
+                await outbound.call("send_message", config.FINAL_MESSAGE_CHAT_ID, msg,
                     parse_mode=enums.ParseMode.MARKDOWN)
             sys.exit()
 
@@ -101,7 +144,7 @@ async def main():
 
                 if rows_count > 0 and config.CSV_CHAT_ID and config.CSV_FILE:
                     header_message = build_ranking_caption()
-                    await app.send_document(config.CSV_CHAT_ID, config.CSV_FILE,
+                    await outbound.call("send_document", config.CSV_CHAT_ID, config.CSV_FILE,
                             caption=header_message)
 
             final_message, winner = create_ranking(participants)
@@ -114,10 +157,9 @@ async def main():
 
 async def start_collector(participants):
     """start check and send collected participants"""
-    # get all unique file ids from CSV
-    unique_ids = get_unique_ids_from_csv()
     # init senders array to prevent abuse
     message_senders = []
+    collect_tasks = []
 
     for participant in participants:
         # prevent from caption abuse, check sender
@@ -131,26 +173,42 @@ async def start_collector(participants):
                 continue
             message_senders.append(participant['sender'])
 
-        # skip this message if it is a repost
-        unique_check = await check_repost(participant, unique_ids)
-        if unique_check:
-            continue
+        collect_tasks.append(asyncio.ensure_future(collect_participant(participant)))
 
-        if not config.SIGN_MESSAGES:
-            participant['author'] = "@" + participant['author']
+    # submit all participants at once, the send queue keeps the order per chat
+    try:
+        await asyncio.gather(*collect_tasks)
+    except BaseException:
+        # stop the other participants like a failed send stopped the loop before
+        for task in collect_tasks:
+            task.cancel()
+        await asyncio.gather(*collect_tasks, return_exceptions=True)
+        raise
+    finally:
+        close_repost_index()
+
+async def collect_participant(participant):
+    """Check participant for reposts and send the collected photo"""
+    # skip this message if it is a repost
+    unique_check = await check_repost(participant)
+    if unique_check:
+        return
 
-        # extract hashtag from caption and update participant
-        message_hashtag = get_caption_pattern(participant['caption'], "#")
-        if message_hashtag:
-            participant['caption'] = participant['author'] + "\n\n" + message_hashtag
-        else:
-            participant['caption'] = participant['author']
+    if not config.SIGN_MESSAGES:
+        participant['author'] = "@" + participant['author']
+
+    # extract hashtag from caption and update participant
+    message_hashtag = get_caption_pattern(participant['caption'], "#")
+    if message_hashtag:
+        participant['caption'] = participant['author'] + "\n\n" + message_hashtag
+    else:
+        participant['caption'] = participant['author']
 
-        # add footer
-        if config.FINAL_MESSAGE_FOOTER != "":
-            participant['caption'] = participant['caption'] + "\n\n" + config.FINAL_MESSAGE_FOOTER
+    # add footer
+    if config.FINAL_MESSAGE_FOOTER != "":
+        participant['caption'] = participant['caption'] + "\n\n" + config.FINAL_MESSAGE_FOOTER
 
-        await send_collected_photo(participant)
+    await send_collected_photo(participant)
 
 async def send_collected_photo(participant):
     """send collected photo from message to POST_PARTICIPANTS_CHAT_ID"""
@@ -161,17 +219,9 @@ async def send_collected_photo(participant):
 
     # send the photo
     if config.POST_PARTICIPANTS_CHAT_ID != "TEST":
-        try:
-            await app.send_photo(config.POST_PARTICIPANTS_CHAT_ID,
-                    participant['photo_id'],
-                    participant['caption'], parse_mode=enums.ParseMode.MARKDOWN)
-        except FloodWait as ex_flood:
-            logging.warning("Wait %s seconds to send more photos...", ex_flood.value)
-            await asyncio.sleep(ex_flood.value)
-            # retry
-            await app.send_photo(config.POST_PARTICIPANTS_CHAT_ID,
-                    participant['photo_id'],
-                    participant['caption'], parse_mode=enums.ParseMode.MARKDOWN)
+        await outbound.call("send_photo", config.POST_PARTICIPANTS_CHAT_ID,
+                participant['photo_id'],
+                participant['caption'], parse_mode=enums.ParseMode.MARKDOWN)
 
 async def send_photo_caption(chatid, photo, caption):
     """split the photo caption into chunks if too long"""
@@ -179,23 +229,56 @@ async def send_photo_caption(chatid, photo, caption):
     i = 0
     for chunk in chunks:
         if i == 0 and photo:
-            await app.send_photo(chatid, photo,
+            await outbound.call("send_photo", chatid, photo,
                     chunk, parse_mode=enums.ParseMode.MARKDOWN)
         else:
-            await app.send_message(chatid, chunk,
+            await outbound.call("send_message", chatid, chunk,
                     parse_mode=enums.ParseMode.MARKDOWN)
         i += 1
 
-async def check_repost(participant, unique_ids):
+@functools.lru_cache(maxsize=1)
+def get_repost_index():
+    """Return the unique id index of CSV_FILE, load it on first use"""
+    if config.CSV_INDEX:
+        index_path = csv_index.get_index_path(config.CSV_FILE, config.CSV_INDEX)
+        repost_index = csv_index.open_index(index_path)
+        rows_count = csv_index.update_index(repost_index, config.CSV_FILE)
+        logging.info("Index %d new unique IDs from CSV %s", rows_count, config.CSV_FILE)
+    else:
+        # without index file keep the first postlink of each unique id
+        repost_index = {}
+        for postlink, unique_id in get_unique_ids_from_csv():
+            repost_index.setdefault(unique_id, postlink)
+
+    return repost_index
+
+def close_repost_index():
+    """Close the unique id index of this run if it was loaded"""
+    if get_repost_index.cache_info().currsize: # pylint: disable=too-many-function-args
+        repost_index = get_repost_index()
+        if not isinstance(repost_index, dict):
+            repost_index.close()
+    get_repost_index.cache_clear()
+
+def find_repost_postlink(unique_id):
+    """Return postlink of a known unique file id or None"""
+    index = get_repost_index()
+    if isinstance(index, dict):
+        return index.get(unique_id)
+
+    return csv_index.find_postlink(index, unique_id)
+
+async def check_repost(participant):
     """check unique file id"""
     unique_check = False
-    for unique_id in unique_ids:
-        if unique_id[1] == participant['unique_id']:
+    if participant['unique_id']:
+        postlink = find_repost_postlink(participant['unique_id'])
+        if postlink:
 
             # send repost message
             repost_msg = (
                 "Dieses Meme ist bereits bekannt, "
-                + f"[schau hier]({unique_id[0]})"
+                + f"[schau hier]({postlink})"
             )
             logging.info("%s (reply to msg id %s, photo id %s)",
                 repost_msg,
@@ -204,12 +287,11 @@ async def check_repost(participant, unique_ids):
             )
 
             if config.FINAL_MESSAGE_CHAT_ID:
-                await app.send_message(config.FINAL_MESSAGE_CHAT_ID, repost_msg,
+                await outbound.call("send_message", config.FINAL_MESSAGE_CHAT_ID, repost_msg,
                         reply_to_message_id=participant['id'],
                         parse_mode=enums.ParseMode.MARKDOWN)
 
             unique_check = True
-            break
 
     return unique_check
 
@@ -232,55 +314,12 @@ async def check_message(message, excludes = True):
 
     return result
 
-async def get_participants(contest_days = config.CONTEST_DAYS):
+async def get_participants(contest_days = None):
     """read chat history and return participants"""
-    contest_time = build_strptime(config.CONTEST_DATE)
-    participants = []
-    duplicate = False
-
-    async for message in app.get_chat_history(config.CHAT_ID):
-
-        check = await check_message(message)
-        if not check:
-            continue
-
-        # check for valid author in message
-        message_author = get_author(message)
-        if not message_author:
-            continue
-
-        # check if message has a timestamp
-        if hasattr(message, "date"):
-            message_time = build_strptime(str(message.date))
-            message_difftime = contest_time - message_time
-        else:
-            continue
-
-        # check if message was in desired timeframe
-        if ( (message_difftime.days < contest_days)
-                and not message_difftime.days < 0 ):
-
-            if not config.PARTICIPANT_DUPLICATES:
-                participants, duplicate = check_participant_duplicates(
-                    participants,
-                    message,
-                    message_author
-                )
-
-            if config.PARTICIPANT_DUPLICATES or not duplicate:
-                # Ranking mode: append to participants array to create ranking
-                new_participant = create_participant(message, message_author)
-                participants.append(new_participant)
-
-        elif message_difftime.days < 0:
-            # message newer than expected or excluded, keep searching messages
-            continue
-
-        else:
-            # message too old from here, stop loop
-            break
+    participant_collector = ParticipantCollector(contest_days)
+    await scan_chat_history([participant_collector])
 
-    return participants
+    return participant_collector.participants
 
 def create_participant(message, author):
     """Return new participant as dict from message object"""
@@ -323,7 +362,7 @@ def create_participant(message, author):
         "unique_id": message.photo.file_unique_id,
         "author": author,
         "sender": message_sender,
-        "date": str(message.date),
+        "date": message.date,
         "id": message.id,
         "chat_id": message.chat.id,
         "caption": message.caption
@@ -335,86 +374,80 @@ def create_participant(message, author):
 
     return participant
 
-def check_participant_duplicates(participants, message, message_author):
-    """check if participant was already found"""
+def check_participant_duplicates(participants, message, message_author, author_index = None):
+    """
+    check if participant was already found
+    author_index maps lowercase authors to participants,
+    it is built from participants if not given
+    """
     message_reactions = get_reactions(message)
     if not message_reactions:
         return participants, True
 
+    if author_index is None:
+        author_index = {}
+        for participant in participants:
+            author_index.setdefault(participant["author"].lower(), participant)
+
     # no views in groups
     message_views = 0
     if hasattr(message, 'views'):
         message_views = message.views
 
-    duplicate = False
-    highest_count = 0
-    for participant in participants:
-
-        if participant["author"].lower() == message_author.lower():
-            duplicate = True
-
-            if config.POST_PARTICIPANTS_CHAT_ID:
-                participant_time = datetime.strptime(
-                        str(participant["date"]),
-                        "%Y-%m-%d %H:%M:%S")
-
-                message_time = build_strptime(str(message.date))
-                if participant_time < message_time:
-                    # remember only the newest meme
-                    participant = create_participant(message, message_author)
-                continue
-
-            if config.RANK_MEMES:
-                # already exist in participants array,
-                # only one post allowed (prefer best)
-                if participant["count"] < message_reactions:
-                    # update existent meme data
-                    participant["photo_id"] = message.photo.file_id
-                    participant["unique_id"] = message.photo.file_unique_id
-                    participant["date"] = str(message.date)
-                    participant["id"] = message.id
-
-                    logging.info("Update Participant %s (%d < %d votes from %s)",
-                            participant["author"],
-                            participant["count"],
-                            message_reactions,
-                            participant["date"])
-
-                    # update stats
-                    participant["count"] = message_reactions
-                    participant["views"] = message_views
-                else:
-                    # nothing to do, keep this
-                    continue
-            else:
-                post_count = participant["count"]
+    participant = author_index.get(message_author.lower())
+    if not participant:
+        duplicate = message_author == "None" and len(participants) > 0
+        return participants, duplicate
 
-                # remember the best meme of current participant
-                highest_count = max(highest_count, post_count)
+    if config.POST_PARTICIPANTS_CHAT_ID:
+        if participant["date"] < message.date:
+            # remember only the newest meme
+            participant.update(create_participant(message, message_author))
+
+    elif config.RANK_MEMES:
+        # already exist in participants array,
+        # only one post allowed (prefer best)
+        if participant["count"] < message_reactions:
+            # update existent meme data
+            participant["photo_id"] = message.photo.file_id
+            participant["unique_id"] = message.photo.file_unique_id
+            participant["date"] = message.date
+            participant["id"] = message.id
+
+            logging.info("Update Participant %s (%d < %d votes from %s)",
+                    participant["author"],
+                    participant["count"],
+                    message_reactions,
+                    participant["date"])
+
+            # update stats
+            participant["count"] = message_reactions
+            participant["views"] = message_views
 
-                if highest_count < message_reactions:
-                    # replace existent meme data with best meme data
-                    participant["photo_id"] = message.photo.file_id
-                    participant["unique_id"] = message.photo.file_unique_id
-                    participant["id"] = message.id
+    else:
+        # remember the best meme of current participant
+        highest_count = max(0, participant["count"])
 
-                participant["date"] = str(message.date)
+        if highest_count < message_reactions:
+            # replace existent meme data with best meme data
+            participant["photo_id"] = message.photo.file_id
+            participant["unique_id"] = message.photo.file_unique_id
+            participant["id"] = message.id
 
-                logging.info("Update Participant %s (%d + %d = %d votes from %s)",
-                        participant["author"],
-                        participant["count"],
-                        message_reactions,
-                        (participant["count"] + message_reactions),
-                        participant["date"])
+        participant["date"] = message.date
 
-                # update reaction counter and views, sum up
-                participant["count"] += message_reactions
-                participant["views"] += message_views
+        logging.info("Update Participant %s (%d + %d = %d votes from %s)",
+                participant["author"],
+                participant["count"],
+                message_reactions,
+                (participant["count"] + message_reactions),
+                participant["date"])
 
-        elif message_author == "None":
-            duplicate = True
+        # update reaction counter and views, sum up
+        participant["count"] += message_reactions
+        participant["views"] += message_views
 
-    return participants, duplicate
+    return participants, True
 
 def get_caption_pattern(caption, pattern, count = 1, return_as_array = False):
     """
@@ -538,13 +571,18 @@ def write_rows_to_csv(participants):
         csv_rows.append([
             participant["author"],
             participant_postlink,
-            participant["date"],
+            str(participant["date"]),
             participant["count"],
             participant["views"],
             config.CONTEST_DAYS,
             participant["unique_id"]
         ])
 
+    # sync columns before the CSV grows
+    columns_data = None
+    if config.CONTEST_COLUMNS_FILE:
+        columns_data = load_contest_columns()
+
     # open file an append rows
     write_header = False
     if not os.path.isfile(config.CSV_FILE):
@@ -571,49 +609,43 @@ def write_rows_to_csv(participants):
         csvwriter.writerows(csv_rows)
         logging.info("CSV update %d rows in %s", len(csv_rows), config.CSV_FILE)
 
+    # index the appended rows
+    if config.CSV_INDEX:
+        index = csv_index.open_index(
+            csv_index.get_index_path(config.CSV_FILE, config.CSV_INDEX))
+        csv_index.update_index(index, config.CSV_FILE)
+        index.close()
+
+    if columns_data is not None:
+        for participant, csv_row in zip(participants, csv_rows):
+            columns_row = dict(zip(contest_columns.CSV_FIELDS, csv_row))
+            columns_row['Timestamp'] = participant["date"]
+            columns_data.append(columns_row)
+        columns_data.csv_size = os.path.getsize(config.CSV_FILE)
+        contest_columns.append(columns_data, config.CONTEST_COLUMNS_FILE)
+        logging.info("Columns update %d rows in %s", len(csv_rows), config.CONTEST_COLUMNS_FILE)
+
     return len(csv_rows)
 
-def get_winner(participants):
-    """Extracts the best post from participants and returns the winner"""
-    best_count = 0
-    winner = []
-    winner_id = -1
+def get_winners(participants, max_ranks = None):
+    """Get the best posts from participants and return winners array"""
+    if max_ranks is None:
+        max_ranks = config.CONTEST_MAX_RANKS
 
     if config.CONTEST_RANKING_BY_VIEWS:
         count = "views"
     else:
         count = "count"
 
-    i = 0
-    for participant in participants:
-
-        if participant[count] >= best_count:
-            best_count = participant[count]
-            winner = participant
-            winner_id = i
-
-        i += 1
-
-    # remove winner from participants array
-    if winner_id != -1 and len(participants) >= 0:
-        participants.pop(winner_id)
-
-    return winner, participants
-
-def get_winners(participants):
-    """Get all winners and return winners array"""
-    winners = []
-
-    i = 1
-    while i <= config.CONTEST_MAX_RANKS:
-        current_winner, participants = get_winner(participants)
-
-        if current_winner:
-            winners.append(current_winner)
-
-        i += 1
+    # same count: less views first, then the later participant
+    ranked = (
+        (participant[count], -participant["views"], i, participant)
+        for i, participant in enumerate(participants)
+        if participant[count] >= 0
+    )
+    winners = heapq.nlargest(max_ranks, ranked, key=lambda x: x[:3])
 
-    return winners
+    return [winner[3] for winner in winners]
 
 async def get_daily_winners(weekly=False):
     """get daily based winners, only one winner each day"""
@@ -625,34 +657,33 @@ async def get_daily_winners(weekly=False):
     else:
         participants = await get_participants(contest_days = config.CONTEST_DAYS+1)
 
-    # find a winner for each contest day
-    week_numbers = []
-    i = 1
-    while i <= config.CONTEST_DAYS+1:
-        daily_ranking_time = contest_time-timedelta(days=i)
-        daily_participants = []
-
-        for participant in participants:
-            participant_time = build_strptime(str(participant['date']))
-            participant_diff_time = contest_time - participant_time
+    # sort participants into contest days in one pass,
+    # day i holds posts from i-1 to i days before CONTEST_DATE
+    daily_participants = {}
+    for participant in participants:
+        participant_diff_time = contest_time - participant['date']
+        if participant_diff_time.days < 1:
+            continue
 
-            if ( (participant_time - daily_ranking_time).days == 0
-                    and (participant_diff_time.days > 0) ):
-                daily_participants.append(participant)
+        day = participant_diff_time.days
+        if participant_diff_time.seconds or participant_diff_time.microseconds:
+            day += 1
 
-        i += 1
+        if day <= config.CONTEST_DAYS+1:
+            daily_participants.setdefault(day, []).append(participant)
 
-        # sort participants by views
-        daily_participants = sorted(daily_participants,
-                key=lambda x: x['views'], reverse = True)
-        winner, _participants = get_winner(daily_participants)
-        if winner:
+    # find a winner for each contest day
+    week_numbers = set()
+    for day in sorted(daily_participants):
+        winners = get_winners(daily_participants[day], 1)
+        if winners:
+            winner = winners[0]
             # check if the winner is weekly or daily
             if weekly:
-                week_number = datetime.date(build_strptime(str(winner['date']))).isocalendar()[1]
+                week_number = winner['date'].isocalendar()[1]
                 if week_number in week_numbers:
                     continue
-                week_numbers.append(week_number)
+                week_numbers.add(week_number)
             logging.info("Add Winner %s from %s", winner['author'], winner['date'])
             daily_winners.append(winner)
 
@@ -660,92 +691,10 @@ async def get_daily_winners(weekly=False):
 
 async def get_poll_winners():
     """get poll based winners"""
-    contest_time = build_strptime(config.CONTEST_DATE)
-    poll_winners = []
+    poll_winner_extractor = PollWinnerExtractor()
+    await scan_chat_history([poll_winner_extractor])
 
-    async for message in app.get_chat_history(config.CHAT_ID):
-        check = await check_message(message, excludes = False)
-        if not check:
-            continue
-
-        # check if message has a timestamp
-        if hasattr(message, "date"):
-            message_time = build_strptime(str(message.date))
-            message_difftime = contest_time - message_time
-        else:
-            continue
-
-        # check if message was in desired timeframe
-        if ( (message_difftime.days < config.CONTEST_DAYS)
-                and not message_difftime.days < 0 ):
-
-            if hasattr(message, "caption"):
-                if message.caption:
-
-                    # count pattern matches
-                    count = 0
-                    for pattern in config.CONTEST_POLL_PATTERN:
-                        if pattern in str(message.caption):
-                            count += 1
-
-                    # message caption must match all given patterns
-                    if count == len(config.CONTEST_POLL_PATTERN):
-
-                        caption = message.caption
-                        if "#1" in caption:
-                            logging.error("TODO: "
-                                "CONTEST_POLL_FROM_POLLS + CONTEST_POLL_RESULT "
-                                "not working yet together.")
-                            # this is a poll result with ranking, do not evaluate
-                            # there is a TEMPLATE_WINNER in config, this counts as poll winner
-                            caption = caption.split("#1")[0]
-
-                        # find all words starting with @ as author
-                        authors = get_caption_pattern(caption,
-                            "@",
-                            count = 5,
-                            return_as_array = True
-                        )
-                        logging.info(caption)
-
-                        # create participants from authors
-                        i = 0
-                        for author in authors:
-                            author = author.replace("@","")
-                            poll_winner = create_participant(message, author)
-
-                            # update postlink in case of media group (draw)
-                            if len(authors) > 1 and hasattr(message, "media_group_id"):
-                                if message.media_group_id is not None:
-                                    # find the postlink in message entities
-                                    entities = find_url_entities(message)
-
-                                    if (len(entities)-1) >= i:
-                                        poll_winner['postlink'] = entities[i].url
-                                        logging.info("Update %s postlink %d: %s",
-                                            author, i, poll_winner['postlink']
-                                        )
-                                    else:
-                                        logging.warning("Postlink was missing in entities")
-
-                                    i += 1
-                            else:
-                                # regular winner, set postlink
-                                entities = find_url_entities(message)
-                                if len(entities) >= 1:
-                                    poll_winner['postlink'] = entities[0].url
-
-                            poll_winners.append(poll_winner)
-
-        elif message_difftime.days < 0:
-            # message newer than expected or excluded, keep searching messages
-            continue
-
-        else:
-            # message too old from here, stop loop
-            break
-
-    return poll_winners
+    return poll_winner_extractor.poll_winners
 
 def create_ranking(participants, unique_ranks = False, sort = True, caption = True):
     """Build the final ranking message"""
@@ -753,9 +702,6 @@ def create_ranking(participants, unique_ranks = False, sort = True, caption = Tr
 
     # get winners
     if sort:
-        # sort participants by views
-        participants = sorted(participants,
-                key=lambda x: x['views'], reverse = True)
         winners = get_winners(participants)
     else:
         # ranking in poll mode
@@ -862,6 +808,378 @@ def create_ranking(participants, unique_ranks = False, sort = True, caption = Tr
 
     return final_message, winner
 
+###########################
+# Chat history methods
+###########################
+
+async def iter_chat_history(contest_days = None, message_filter = None):
+    """
+    yield chat messages from newest to oldest, from message store or chat history
+    Set message_filter to let telegram search for this media type only
+    """
+    if contest_days is None:
+        contest_days = config.CONTEST_DAYS
+
+    if config.MESSAGE_STORE:
+        messages = await sync_message_store(contest_days)
+        for message in messages:
+            yield message
+    elif config.SCAN_MEDIA_FILTER and message_filter:
+        async for message in search_chat_history(message_filter):
+            yield message
+    else:
+        async for message in app.get_chat_history(config.CHAT_ID,
+                offset_date=get_history_offset_date()):
+            yield message
+
+async def search_chat_history(message_filter):
+    """
+    yield messages matching a media filter from newest to oldest,
+    walk the chat history from CONTEST_DATE if it is too far in the past
+    """
+    offset_date = get_history_offset_date()
+    skipped = 0
+
+    # search_messages can not start at a date, skip newer messages
+    async for message in app.search_messages(config.CHAT_ID, filter=message_filter):
+        if message.date < offset_date:
+            yield message
+            continue
+
+        skipped += 1
+        if skipped > SEARCH_SKIP_LIMIT:
+            # nothing was yielded yet, newer messages come first
+            logging.info("Search found more than %d messages after CONTEST_DATE, "
+                "walk the chat history instead", SEARCH_SKIP_LIMIT)
+            async for history_message in app.get_chat_history(config.CHAT_ID,
+                    offset_date=offset_date):
+                yield history_message
+            return
+
+def get_history_offset_date():
+    """Return offset date to start the chat history at CONTEST_DATE"""
+    contest_time = build_strptime(config.CONTEST_DATE)
+    # telegram only returns messages older than offset date
+    return contest_time + timedelta(seconds=1)
+
+async def sync_message_store(contest_days):
+    """Sync new and unsettled messages into the store and return the contest window"""
+    contest_time = build_strptime(config.CONTEST_DATE)
+    window_start = contest_time - timedelta(days=contest_days)
+    chat_key = str(config.CHAT_ID)
+    sync_time = datetime.now()
+    store = message_store.open_store(config.MESSAGE_STORE)
+
+    try:
+        state = message_store.get_sync_state(store, chat_key)
+
+        # fetch messages up to CONTEST_DATE, newer than the last synced message
+        if not state or timestamps.from_timestamp(state["newest_date"]) < contest_time:
+            newest_id = state["newest_id"] if state else 0
+            messages = []
+            async for message in app.get_chat_history(config.CHAT_ID,
+                    offset_date=get_history_offset_date()):
+                if message.id <= newest_id:
+                    break
+                messages.append(message)
+                if not state and message.date <= window_start:
+                    break
+
+            stored = message_store.save_messages(store, chat_key, messages, sync_time)
+            logging.info("Message store: fetched %d new messages (%d stored)",
+                len(messages), stored)
+
+            if messages and state:
+                state["newest_id"] = messages[0].id
+                state["newest_date"] = timestamps.to_timestamp(messages[0].date)
+            elif messages:
+                state = {
+                    "newest_id": messages[0].id,
+                    "newest_date": timestamps.to_timestamp(messages[0].date),
+                    "oldest_id": messages[-1].id,
+                    "oldest_date": timestamps.to_timestamp(messages[-1].date)
+                }
+                if messages[-1].date > window_start:
+                    # reached the beginning of chat history
+                    state["oldest_date"] = 0
+
+            if state:
+                message_store.set_sync_state(store, chat_key, state)
+
+        # fetch older messages if the contest window was never synced
+        if state and timestamps.from_timestamp(state["oldest_date"]) > window_start:
+            messages = []
+            async for message in app.get_chat_history(config.CHAT_ID,
+                    offset_id=state["oldest_id"]):
+                messages.append(message)
+                if message.date <= window_start:
+                    break
+
+            stored = message_store.save_messages(store, chat_key, messages, sync_time)
+            logging.info("Message store: fetched %d older messages (%d stored)",
+                len(messages), stored)
+
+            if messages:
+                state["oldest_id"] = messages[-1].id
+                state["oldest_date"] = timestamps.to_timestamp(messages[-1].date)
+            if not messages or messages[-1].date > window_start:
+                # reached the beginning of chat history
+                state["oldest_date"] = 0
+            message_store.set_sync_state(store, chat_key, state)
+
+        # refresh reactions and views of messages which were still active
+        unsettled_ids = message_store.get_unsettled_ids(store, chat_key,
+            window_start, contest_time, config.MESSAGE_STORE_SETTLE_DAYS, sync_time)
+        for i in range(0, len(unsettled_ids), 200):
+            chunk = unsettled_ids[i:i+200]
+            messages = await app.get_messages(config.CHAT_ID, chunk)
+            deleted_ids = [
+                message_id for message_id, message in zip(chunk, messages)
+                if not message or message.empty
+            ]
+            message_store.save_messages(store, chat_key, messages, sync_time)
+            message_store.delete_messages(store, chat_key, deleted_ids)
+
+        if unsettled_ids:
+            logging.info("Message store: refreshed %d messages", len(unsettled_ids))
+
+        messages = message_store.load_messages(store, chat_key, window_start, contest_time)
+        logging.info("Message store: read %d messages from %s",
+            len(messages), config.MESSAGE_STORE)
+    finally:
+        store.close()
+
+    return messages
+
+async def scan_chat_history(consumers):
+    """Walk the chat history once and feed each message to all consumers"""
+    contest_time = build_strptime(config.CONTEST_DATE)
+    contest_days = max(consumer.contest_days for consumer in consumers)
+
+    # search server side if all consumers need the same media type
+    message_filters = {consumer.message_filter for consumer in consumers}
+    message_filter = message_filters.pop() if len(message_filters) == 1 else None
+
+    async for message in iter_chat_history(contest_days, message_filter):
+
+        # check if message has a timestamp
+        if hasattr(message, "date"):
+            message_difftime = contest_time - message.date
+        else:
+            continue
+
+        if message_difftime.days < 0:
+            # message newer than expected, keep searching messages
+            continue
+
+        for consumer in consumers:
+            if consumer.done:
+                continue
+
+            # check if message was in desired timeframe of this consumer
+            if message_difftime.days < consumer.contest_days:
+                await consumer.consume(message)
+            else:
+                consumer.done = True
+
+        if all(consumer.done for consumer in consumers):
+            # message too old or all consumers finished, stop loop
+            break
+
+class ScanConsumer:
+    """Base class for consumers of scan_chat_history"""
+
+    # media type to search for or None to walk the full chat history
+    message_filter = None
+
+    def __init__(self, contest_days = None):
+        if contest_days is None:
+            contest_days = config.CONTEST_DAYS
+        self.contest_days = contest_days
+        # set to True to stop receiving messages
+        self.done = False
+
+    async def consume(self, message):
+        """handle a message from the contest timeframe"""
+        raise NotImplementedError
+
+class ParticipantCollector(ScanConsumer):
+    """Collect contest participants from photo messages"""
+
+    message_filter = enums.MessagesFilter.PHOTO
+
+    def __init__(self, contest_days = None):
+        super().__init__(contest_days)
+        self.participants = []
+        # lowercase author to participant
+        self.author_index = {}
+
+    async def consume(self, message):
+        """add message author as participant"""
+        check = await check_message(message)
+        if not check:
+            return
+
+        # check for valid author in message
+        message_author = get_author(message)
+        if not message_author:
+            return
+
+        duplicate = False
+        if not config.PARTICIPANT_DUPLICATES:
+            self.participants, duplicate = check_participant_duplicates(
+                self.participants,
+                message,
+                message_author,
+                self.author_index
+            )
+
+        if config.PARTICIPANT_DUPLICATES or not duplicate:
+            # Ranking mode: append to participants array to create ranking
+            new_participant = create_participant(message, message_author)
+            self.participants.append(new_participant)
+            self.author_index.setdefault(message_author.lower(), new_participant)
+
+class HashtagCounter(ScanConsumer):
+    """Collect hashtags from photo message captions"""
+
+    message_filter = enums.MessagesFilter.PHOTO
+
+    def __init__(self, contest_days = None):
+        super().__init__(contest_days)
+        self.hashtags = []
+
+    async def consume(self, message):
+        """add the first hashtag of message caption"""
+        check = await check_message(message)
+        if not check:
+            return
+
+        # check for valid author in message
+        if not get_author(message):
+            return
+
+        message_hashtag = get_caption_pattern(message.caption, "#")
+        if message_hashtag:
+            self.hashtags.append(message_hashtag)
+
+class PollFinder(ScanConsumer):
+    """Find the last open poll matches CONTEST_POLL_PATTERN"""
+
+    def __init__(self, contest_days = None):
+        super().__init__(contest_days)
+        self.poll_message = False
+
+    async def consume(self, message):
+        """remember the first open poll found and stop"""
+        if str(message.media) != "MessageMediaType.POLL":
+            return
+
+        if hasattr(message, 'forward_from_message_id'):
+            if message.forward_from_message_id is not None:
+                # this was a forwarded poll, can not be evaluated
+                return
+
+        if hasattr(message.poll, 'is_closed'):
+            if message.poll.is_closed:
+                return
+
+        if not hasattr(message.poll, 'question'):
+            return
+
+        # count pattern matches
+        count = 0
+        for pattern in config.CONTEST_POLL_PATTERN:
+            if pattern in str(message.poll.question):
+                count += 1
+
+        # message poll question must match all given patterns
+        if count != len(config.CONTEST_POLL_PATTERN):
+            return
+
+        if config.MESSAGE_STORE:
+            # stored poll state can be outdated, verify it is still open
+            message = await app.get_messages(config.CHAT_ID, message.id)
+            if message.empty or message.poll.is_closed:
+                return
+
+        self.poll_message = message
+        self.done = True
+
+class PollWinnerExtractor(ScanConsumer):
+    """Collect poll winners from poll result messages"""
+
+    message_filter = enums.MessagesFilter.PHOTO
+
+    def __init__(self, contest_days = None):
+        super().__init__(contest_days)
+        self.poll_winners = []
+
+    async def consume(self, message):
+        """add winners of a poll result message"""
+        check = await check_message(message, excludes = False)
+        if not check:
+            return
+
+        if not getattr(message, "caption", None):
+            return
+
+        # count pattern matches
+        count = 0
+        for pattern in config.CONTEST_POLL_PATTERN:
+            if pattern in str(message.caption):
+                count += 1
+
+        # message caption must match all given patterns
+        if count != len(config.CONTEST_POLL_PATTERN):
+            return
+
+        caption = message.caption
+        if "#1" in caption:
+            logging.error("TODO: "
+                "CONTEST_POLL_FROM_POLLS + CONTEST_POLL_RESULT "
+                "not working yet together.")
+            # this is a poll result with ranking, do not evaluate
+            # there is a TEMPLATE_WINNER in config, this counts as poll winner
+            caption = caption.split("#1")[0]
+
+        # find all words starting with @ as author
+        authors = get_caption_pattern(caption,
+            "@",
+            count = 5,
+            return_as_array = True
+        )
+        logging.info(caption)
+
+        # create participants from authors
+        i = 0
+        for author in authors:
+            author = author.replace("@","")
+            poll_winner = create_participant(message, author)
+
+            # update postlink in case of media group (draw)
+            if ( len(authors) > 1
+                    and getattr(message, "media_group_id", None) is not None ):
+                # find the postlink in message entities
+                entities = find_url_entities(message)
+
+                if (len(entities)-1) >= i:
+                    poll_winner['postlink'] = entities[i].url
+                    logging.info("Update %s postlink %d: %s",
+                        author, i, poll_winner['postlink']
+                    )
+                else:
+                    logging.warning("Postlink was missing in entities")
+
+                i += 1
+            elif len(authors) <= 1 or not hasattr(message, "media_group_id"):
+                # regular winner, set postlink
+                entities = find_url_entities(message)
+                if len(entities) >= 1:
+                    poll_winner['postlink'] = entities[0].url
+
+            self.poll_winners.append(poll_winner)
+
 ###########################
 # Highscore methods
 ###########################
@@ -888,200 +1206,144 @@ def find_url_entities(message):
 
     return url_entities
 
-async def update_highscore(winner_name):
-    """Update the highscore message"""
-    message = await get_message_from_postlink(config.CONTEST_HIGHSCORE)
-    entities = find_url_entities(message)
-    add_entity_offset = 0
-    highscore = False
+async def get_highscore_messages():
+    """Return postlinks and messages of all highscore pages"""
+    pages = []
+    postlink = config.CONTEST_HIGHSCORE
+    while postlink and postlink not in [page[0] for page in pages]:
+        message = await get_message_from_postlink(postlink)
+        text = get_highscore_text(message)
+        if text is None:
+            break
+        pages.append((postlink, message))
 
-    if not message:
-        logging.error("Update highscore: failed, "
-            "message not found from %s ('Copy Post Link' "
-            "in Telegram for valid link)",
-            config.CONTEST_HIGHSCORE
+        # follow the continuation link to the next page
+        postlink = highscore.find_next_link(
+            text, find_url_entities(message), config.CONTEST_HIGHSCORE_NEXT
         )
-        return False
-
-    if hasattr(message, 'text'):
-        if message.text is not None:
-            # this is a standard message
-            logging.info("Update highscore: text found in %s", config.CONTEST_HIGHSCORE)
-            highscore = message.text
-
-    if hasattr(message, 'caption'):
-        if message.caption is not None:
-            # this is a photo message
-            logging.info("Update highscore: caption found in %s", config.CONTEST_HIGHSCORE)
-            highscore = message.caption
 
-    if not highscore:
-        logging.error("Update highscore: failed, message text was missing in %s",
+    return pages
+
+def get_highscore_text(message):
+    """Return text or caption of a highscore message or None"""
+    if not message or getattr(message, "empty", False):
+        return None
+    if getattr(message, "caption", None) is not None:
+        return message.caption
+    return getattr(message, "text", None)
+
+async def read_highscore():
+    """Return highscore model and pages from the ledger or the highscore messages"""
+    ledger = config.CONTEST_HIGHSCORE_LEDGER
+    if ledger and os.path.isfile(ledger):
+        return highscore.load(ledger, config.RANKING_WINNER_SUFFIX)
+
+    messages = await get_highscore_messages()
+    if not messages:
+        return None, []
+
+    if ledger:
+        logging.info("Highscore ledger: create %s from %s", ledger, config.CONTEST_HIGHSCORE)
+
+    ranking = highscore.parse_pages(
+        [(get_highscore_text(message), find_url_entities(message)) for _, message in messages],
+        config.CONTEST_HIGHSCORE_NEXT,
+        config.RANKING_WINNER_SUFFIX
+    )
+    pages = [
+        {
+            "postlink": postlink,
+            "caption": getattr(message, "caption", None) is not None,
+            "text": get_highscore_text(message)
+        }
+        for postlink, message in messages
+    ]
+    return ranking, pages
+
+async def update_highscore(winner_names):
+    """Update the highscore messages with all winners"""
+    ranking, pages = await read_highscore()
+    if ranking is None:
+        logging.error("Update highscore: failed, "
+            "message text not found from %s ('Copy Post Link' "
+            "in Telegram for valid link)",
             config.CONTEST_HIGHSCORE
         )
         return False
 
-    # find and edit the winner
-    new_highscore = ""
-    highscore_lines = highscore.split("\n")
-    new_highscore_lines = []
-    found_winner = False
-
-    count_ranks = 0
-    count_lines = 0
-    count_offset = 0
-    next_line = 0
-    rank_prefix = ""
-
-    for line in highscore_lines:
-        count_lines += 1
-
-        # remember amount of chars as offset till the highscore list begins
-        if count_ranks == 0:
-            count_offset += len(line)
-
-        if len(line) >= 2:
-            if line[0].isdigit() or line[1].isdigit():
-                # remember rank prefix like # if used
-                if not line[0].isdigit():
-                    rank_prefix = line[0]
-                count_ranks += 1
-                next_line = count_lines
-
-                if line.lower().find(winner_name.lower()) > 0:
-
-                    words = line.split(" ")
-                    if len(words) >= 3:
-                        for word in words:
-                            if winner_name.lower() == word.lower():
-                                found_winner = True
-                                logging.info("Update highscore: %s (ranks: %d)",
-                                    winner_name,
-                                    count_ranks
-                                )
-                                line, highscore_lines[next_line], offset = update_highscore_line(
-                                    line,
-                                    highscore_lines[next_line],
-                                    winner_name
-                                )
-                                add_entity_offset += offset
-
-        # remember the line and modifications in a new array
-        new_highscore_lines.append(line)
-
-    if not found_winner:
-        add_entity_offset += 1
-        # append winner to highscore
-        if new_highscore_lines[next_line] == "":
-            found_winner = True
-            new_line = (str(rank_prefix)
-                + str(count_ranks+1)
-                + "  "
-                + str(winner_name)
-                + " 1x"
-                + str(config.RANKING_WINNER_SUFFIX)
-                + "\n")
-            new_highscore_lines[next_line] += new_line
-            logging.info("Update highscore: add new winner %s",
-                new_highscore_lines[next_line]
-            )
-
-    # rebuild the highscore message from modified lines
-    new_highscore = "\n".join(new_highscore_lines)
-
-    # fix entity offsets, do not break links
-    add_entity_offset += len(new_highscore) - len(highscore)
-    for entity in entities:
-        if hasattr(entity,"offset"):
-            # only entities after the list has grown
-            if count_offset < entity.offset:
-                entity.offset = entity.offset + add_entity_offset
-
-    # finally update highscore message
-    if found_winner:
-        chat_id = get_chat_id_from_postlink(config.CONTEST_HIGHSCORE)
-        message_id = get_message_id_from_postlink(config.CONTEST_HIGHSCORE)
-        if chat_id and message_id:
-            try:
-                await app.edit_message_text(
-                        chat_id, message_id, new_highscore, entities = entities
-                )
-            except MessageNotModified as ex_modified:
-                logging.error(ex_modified)
-                # logging.warning("TODO: Test retry edit message")
-                # if hasattr(ex_modified, "count"):
-                #     logging.warning("Wait %d seconds to send more photos...", ex_modified.count)
-                #     await asyncio.sleep(ex_modified.count + 1)
-                #     await app.edit_message_text(
-                #             chat_id, message_id, new_highscore, entities = entities
-                #     )
-                # else:
-                #     logging.error("Edit message failed!")
-        else:
-            logging.error("Update highscore: failed, "
-                "chat id and/or message id was not found in %s",
-                config.CONTEST_HIGHSCORE
-            )
-    else:
-        logging.warning("Update highscore: winner %s was not found in highscore (%s)",
+    for winner_name in winner_names:
+        entry = ranking.add_medal(winner_name)
+        logging.info("Update highscore: %s %dx%s (rank %d)",
             winner_name,
-            config.CONTEST_HIGHSCORE
+            entry["medals"],
+            config.RANKING_WINNER_SUFFIX,
+            entry["rank"]
         )
 
-def update_highscore_line(line, next_line, winner_name):
-    """Update the line in highscore"""
-    medal_pos = line.find(config.RANKING_WINNER_SUFFIX)
-    offset = 0
-
-    if medal_pos > 0:
-        if not line[medal_pos-1] == "x":
-            line = line.replace(config.RANKING_WINNER_SUFFIX,
-                "1x" + config.RANKING_WINNER_SUFFIX,
-                1
-            )
-            logging.info("Update highscore: fix counter 1x%s", config.RANKING_WINNER_SUFFIX)
-        # medal counter found, increase
-        line = update_highscore_medal_counter(line)
-    else:
-        # first medal, just append
-        if line.endswith(winner_name):
-            line += " "
-        line += "1x" + config.RANKING_WINNER_SUFFIX
-        offset += 1
-        logging.info("Update highscore: append new 1x%s", config.RANKING_WINNER_SUFFIX)
+    # keep the medals even if editing the messages fails
+    if config.CONTEST_HIGHSCORE_LEDGER:
+        highscore.save(config.CONTEST_HIGHSCORE_LEDGER, ranking, pages)
 
-    return line, next_line, offset
+    result = await edit_highscore_messages(pages, ranking)
 
-def update_highscore_medal_counter(line):
-    """Find and update the medal counter"""
-    found_medal = False
-    found_counter = False
-    num_string = ""
+    if config.CONTEST_HIGHSCORE_LEDGER:
+        highscore.save(config.CONTEST_HIGHSCORE_LEDGER, ranking, pages)
 
-    for char in reversed(line):
-        if char == config.RANKING_WINNER_SUFFIX:
-            found_medal = True
+    return result
 
-        if found_medal and char.isdigit():
-            found_counter = True
+async def edit_highscore_messages(pages, ranking):
+    """
+    Render the highscore and edit pages with changed text,
+    send new pages if needed
+    """
+    chat_id = get_chat_id_from_postlink(config.CONTEST_HIGHSCORE)
+    if not chat_id or not get_message_id_from_postlink(config.CONTEST_HIGHSCORE):
+        logging.error("Update highscore: failed, "
+            "chat id and/or message id was not found in %s",
+            config.CONTEST_HIGHSCORE
+        )
+        return False
 
-        if found_counter and char.isdigit():
-            num_string += char
+    new_pages = ranking.split(
+        [
+            highscore.CAPTION_LENGTH if page["caption"] else highscore.MESSAGE_LENGTH
+            for page in pages
+        ],
+        config.CONTEST_HIGHSCORE_NEXT
+    )
 
-        if found_counter and not char.isdigit():
-            break
+    # send pages which do not exist yet, links are added below
+    for text, entities in new_pages[len(pages):]:
+        message = await outbound.call("send_message", chat_id, text, entities = entities)
+        pages.append({
+            "postlink": f"{config.CONTEST_HIGHSCORE.rsplit('/', 1)[0]}/{message.id}",
+            "caption": False,
+            "text": text
+        })
+        logging.info("Update highscore: new page %s", pages[-1]["postlink"])
+
+    for i, (text, entities) in enumerate(new_pages):
+        if i + 1 < len(new_pages):
+            text, entities = highscore.add_next_link(
+                text, entities, config.CONTEST_HIGHSCORE_NEXT, pages[i + 1]["postlink"]
+            )
 
-    medal_counter = ""
-    for num_char in reversed(num_string):
-        medal_counter = medal_counter + num_char
+        # only edit if the rendered text has changed
+        if text == pages[i]["text"]:
+            continue
 
-    if medal_counter != "":
-        search_string = medal_counter + "x" + config.RANKING_WINNER_SUFFIX
-        replace_string = str(int(medal_counter) + 1) + "x" + config.RANKING_WINNER_SUFFIX
-        line = line.replace(search_string, replace_string)
-        logging.info("Update highscore: %s -> %s", search_string, replace_string)
+        message_id = get_message_id_from_postlink(pages[i]["postlink"])
+        try:
+            edited_message = await outbound.call("edit_message_text",
+                    chat_id, message_id, text, entities = entities
+            )
+            if edited_message:
+                message_cache.update(chat_id, message_id, edited_message)
+        except MessageNotModified as ex_modified:
+            logging.error(ex_modified)
+        pages[i]["text"] = text
 
-    return line
+    return True
 
 ###########################
 # Hashtag methods
@@ -1089,43 +1351,10 @@ def update_highscore_medal_counter(line):
 
 async def create_hashtaglist():
     """Create the hashtag list message"""
-    contest_time = build_strptime(config.CONTEST_DATE)
-    hashtags = []
-
     # collect hashtags
-    async for message in app.get_chat_history(config.CHAT_ID):
-
-        check = await check_message(message)
-        if not check:
-            continue
-
-        # check for valid author in message
-        message_author = get_author(message)
-        if not message_author:
-            continue
-
-        # check if message has a timestamp
-        if hasattr(message, "date"):
-            message_time = build_strptime(str(message.date))
-            message_difftime = contest_time - message_time
-        else:
-            continue
-
-        # check if message was in desired timeframe
-        if ( (message_difftime.days < config.CONTEST_DAYS)
-                and not message_difftime.days < 0 ):
-
-            message_hashtag = get_caption_pattern(message.caption, "#")
-            if message_hashtag:
-                hashtags.append(message_hashtag)
-
-        elif message_difftime.days < 0:
-            # message newer than expected or excluded, keep searching messages
-            continue
-
-        else:
-            # message too old from here, stop loop
-            break
+    hashtag_counter = HashtagCounter()
+    await scan_chat_history([hashtag_counter])
+    hashtags = hashtag_counter.hashtags
 
     # create a dict from hashtags and count
     hashtaglist = {i:hashtags.count(i) for i in hashtags}
@@ -1157,67 +1386,25 @@ async def create_hashtaglist():
                 hashtagmsg
             )
         else:
-            await app.send_message(config.FINAL_MESSAGE_CHAT_ID, hashtagmsg,
+            await outbound.call("send_message", config.FINAL_MESSAGE_CHAT_ID, hashtagmsg,
                 parse_mode=enums.ParseMode.MARKDOWN)
 
 ###########################
 # Poll mode methods
 ###########################
 
-async def find_open_poll():
-    """search for the last open poll matches CONTEST_POLL_PATTERN"""
-    contest_time = build_strptime(config.CONTEST_DATE)
-    poll_message = False
-
-    async for message in app.get_chat_history(config.CHAT_ID):
-
-        if str(message.media) != "MessageMediaType.POLL":
-            continue
-
-        if hasattr(message, 'forward_from_message_id'):
-            if message.forward_from_message_id is not None:
-                # this was a forwarded poll, can not be evaluated
-                continue
-
-        if hasattr(message.poll, 'is_closed'):
-            if message.poll.is_closed:
-                continue
-
-        # check if message has a timestamp
-        if hasattr(message, "date"):
-            message_time = build_strptime(str(message.date))
-            message_difftime = contest_time - message_time
-        else:
-            continue
-
-        # check if message was in desired timeframe
-        if ( (message_difftime.days < config.CONTEST_DAYS)
-                and not message_difftime.days < 0 ):
-
-            if hasattr(message.poll, 'question'):
-                # count pattern matches
-                count = 0
-                for pattern in config.CONTEST_POLL_PATTERN:
-                    if pattern in str(message.poll.question):
-                        count += 1
-
-                # message poll question must match all given patterns
-                if count == len(config.CONTEST_POLL_PATTERN):
-                    poll_message = message
-                    break
-
-        elif message_difftime.days < 0:
-            # message newer than expected or excluded, keep searching messages
-            continue
-
-        else:
-            # message too old from here, stop loop
-            break
+async def find_open_poll(consumers = ()):
+    """
+    search for the last open poll matches CONTEST_POLL_PATTERN
+    Additional scan consumers are fed within the same history walk
+    """
+    poll_finder = PollFinder()
+    await scan_chat_history([poll_finder, *consumers])
 
-    if not poll_message:
+    if not poll_finder.poll_message:
         logging.warning("No poll found, nothing to evaluate!")
 
-    return poll_message
+    return poll_finder.poll_message
 
 def postlinks_from_caption(message, winners):
     """Get postlinks from caption text"""
@@ -1248,7 +1435,14 @@ def postlinks_from_caption(message, winners):
 async def evaluate_poll():
     """search for the last open poll and evaluate"""
     result = False
-    poll_message = await find_open_poll()
+    highscore_winners = []
+    scan_consumers = []
+    participant_collector = ParticipantCollector(config.CONTEST_DAYS+1)
+    if config.CONTEST_POLL_RESULT_RANKING and not config.PARTICIPANTS_FROM_CSV:
+        # collect ranking participants within the same history walk
+        scan_consumers.append(participant_collector)
+
+    poll_message = await find_open_poll(scan_consumers)
 
     if not poll_message:
         return False
@@ -1262,7 +1456,7 @@ async def evaluate_poll():
 
     # stop the poll and update poll message with results
     logging.info("Stop poll now (message id: %s)", poll_message.id)
-    poll_message = await app.stop_poll(config.CHAT_ID, poll_message.id)
+    poll_message = await outbound.call("stop_poll", config.CHAT_ID, poll_message.id)
 
     if not hasattr(poll_message, 'options'):
         logging.error("Poll message is missing results, stop first")
@@ -1351,9 +1545,12 @@ async def evaluate_poll():
         poll_winners = []
         first_photo_id = False
 
+        postlink_messages = await get_messages_from_postlinks(
+            [postlink['url'] for postlink in postlinks])
+
         i = 0
         for postlink in postlinks:
-            message = await get_message_from_postlink(postlink['url'])
+            message = postlink_messages[postlink['url']]
 
             message_author = get_author(message)
 
@@ -1411,13 +1608,10 @@ async def evaluate_poll():
                 )
                 final_message, winner = create_ranking(csv_participants)
             else:
-                participants = await get_participants(
-                        contest_days = config.CONTEST_DAYS+1
-                )
-                final_message, winner = create_ranking(participants)
+                final_message, winner = create_ranking(participant_collector.participants)
 
             if config.CONTEST_HIGHSCORE:
-                await update_highscore(winner['display_name'])
+                highscore_winners.append(winner['display_name'])
         else:
             final_message = (
                 f"{config.FINAL_MESSAGE_HEADER}"
@@ -1433,14 +1627,14 @@ async def evaluate_poll():
             media_group.append(InputMediaPhoto(first_photo_id, final_message))
             if len(media_group) > 1:
                 if len(media_group) <= 10:
-                    await app.send_media_group(config.FINAL_MESSAGE_CHAT_ID, media_group,
-                        reply_to_message_id=poll_reply_message_id)
+                    await outbound.call("send_media_group", config.FINAL_MESSAGE_CHAT_ID,
+                        media_group, reply_to_message_id=poll_reply_message_id)
                 else:
                     logging.error("Telegram Limit reached, media %d/10", len(media_group))
                     logging.error("TODO: Split message automatically")
                     sys.exit(1)
             else:
-                await app.send_photo(config.FINAL_MESSAGE_CHAT_ID, first_photo_id,
+                await outbound.call("send_photo", config.FINAL_MESSAGE_CHAT_ID, first_photo_id,
                     final_message, parse_mode=enums.ParseMode.MARKDOWN,
                     reply_to_message_id=poll_reply_message_id)
 
@@ -1453,11 +1647,15 @@ async def evaluate_poll():
                     else:
                         winner_name = winner.replace(config.RANKING_WINNER_SUFFIX, "")
 
-                    await update_highscore(winner_name)
+                    highscore_winners.append(winner_name)
 
             result = True
         else:
             logging.error("First photo id not found")
+
+        # one highscore edit for all winners
+        if highscore_winners:
+            await update_highscore(highscore_winners)
     else:
         logging.error("No postlinks found in caption_entities")
 
@@ -1492,54 +1690,64 @@ async def create_poll():
         for _ in range(3):
             color.append(random.randint(0, 255))
 
-    rank = 1
+    # download all winner photos concurrently and render each
+    # in a worker process as soon as it arrives, keep rank order
+    winners = winners[:config.CONTEST_MAX_RANKS]
     for winner in winners:
-        winner_date = build_strptime(winner['date'])
-        winner_date_formatted = winner_date.strftime(config.DATE_FORMATTING)
-
         if not "postlink" in winner:
             winner["postlink"] = build_postlink(winner)
+    winner_messages = await get_messages_from_postlinks(
+        [winner["postlink"] for winner in winners])
+
+    download_slots = asyncio.Semaphore(config.CONTEST_POLL_DOWNLOADS)
+    with contextlib.ExitStack() as stack:
+        executor = None
+        if config.CONTEST_POLL_WORKERS:
+            # do not fork the running client threads, spawned workers skip load_runtime
+            executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=min(config.CONTEST_POLL_WORKERS, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn")))
+
+        numbered_photos = await asyncio.gather(*[
+            create_numbered_winner_photo(winner, winner_messages[winner["postlink"]],
+                rank, color, download_slots, executor)
+            for rank, winner in enumerate(winners, start=1)
+        ])
 
-        logging.info("Create numbered image %s from %s", rank, winner["postlink"])
-
-        # get photo id
-        winner_photo_id = await get_photo_id_from_postlink(winner["postlink"])
-        if winner_photo_id:
+    if config.MEDIA_CACHE:
+        # evict once after all poll photos are cached
+        media_cache.evict(config.MEDIA_CACHE, config.MEDIA_CACHE_SIZE * 1024 * 1024)
 
-            media = await download_media(winner_photo_id)
+    # poll timeframe does not depend on a skipped winner photo
+    if winners:
+        poll_end_date = winners[0]['date'].strftime(config.DATE_FORMATTING)
+        poll_start_date = contest_time-timedelta(days=config.CONTEST_DAYS)
+        poll_start_date = poll_start_date.strftime(config.DATE_FORMATTING)
 
-            image_path = create_numbered_photo(media, rank, color)
-            if not image_path:
-                logging.error(
-                    "Create numbered photo failed for rank %d (%s)",
-                    rank,
-                    winner["postlink"]
-                )
-                sys.exit()
+    rank = 1
+    for winner, numbered_photo in zip(winners, numbered_photos):
+        winner_date_formatted = winner['date'].strftime(config.DATE_FORMATTING)
 
-            if rank == 1:
-                poll_end_date = winner_date_formatted
-                poll_start_date = contest_time-timedelta(days=config.CONTEST_DAYS)
-                poll_start_date = poll_start_date.strftime(config.DATE_FORMATTING)
+        if numbered_photo:
 
-                media_group.append(InputMediaPhoto(image_path, final_message))
+            if not media_group:
+                # the first photo of the album shows the ranking
+                media_group.append(InputMediaPhoto(numbered_photo, final_message))
             else:
-                media_group.append(InputMediaPhoto(image_path))
+                media_group.append(InputMediaPhoto(numbered_photo))
 
             poll_answers.append(f"{rank}. Meme ({winner_date_formatted})")
         else:
-            logging.warning("Winner photo not found from %s", winner["postlink"])
+            logging.warning("Skip winner photo from %s", winner["postlink"])
 
         rank += 1
-        if rank > config.CONTEST_MAX_RANKS:
-            break
 
     logging.info("poll timeframe found: %s - %s", poll_start_date, poll_end_date)
 
     if config.FINAL_MESSAGE_CHAT_ID:
         media_group_message = ""
         if len(media_group) <= 10:
-            media_group_message = await app.send_media_group(
+            media_group_message = await outbound.call("send_media_group",
                 config.FINAL_MESSAGE_CHAT_ID,
                 media_group
             )
@@ -1562,7 +1770,7 @@ async def create_poll():
             )
 
         if len(media_group_message) > 0:
-            await app.send_poll(
+            await outbound.call("send_poll",
                 config.FINAL_MESSAGE_CHAT_ID,
                 poll_message_header,
                 poll_answers,
@@ -1571,96 +1779,120 @@ async def create_poll():
         else:
             logging.error("No media found to create poll")
 
-async def download_media(photo_id):
-    """Download media and retry on failure"""
-    media = False
-
-    i = 0
-    max_loop = 3
-    while i <= max_loop:
-        media = await app.download_media(photo_id, in_memory=True)
-        if media:
-            break
-        # wait some time and retry download
-        logging.warning("Retry download media (%d/%d), sleep 60s ...", i, max_loop)
-        time.sleep(60)
-        i += 1
-
-    if not media:
-        logging.error("Download media failed with %s", photo_id)
-        sys.exit()
-
+async def create_numbered_winner_photo(winner, message, rank, color, download_slots,
+        executor = None):
+    """
+    Download the photo of a winner message and create the numbered image,
+    return the photo in memory or None if it is missing or failed
+    """
+    async with download_slots:
+        # get photo id
+        if not message:
+            logging.error("Cant find photo id from postlink: %s", winner["postlink"])
+            return None
+        winner_photo_id = get_photo_id_from_msg(message)
+        if not winner_photo_id:
+            return None
+
+        unique_id = message.photo.file_unique_id
+        numbered_key = ("numbered", unique_id, rank, tuple(color[:3]), poll_images.THUMBNAIL_SIZE)
+        numbered_photo = load_cached_media(numbered_key, f"image_{rank}.png")
+        if numbered_photo:
+            logging.info("Numbered image %s from cache (%s)", rank, winner["postlink"])
+            return numbered_photo
+
+        media = await download_media(winner_photo_id, unique_id)
+        if not media:
+            logging.error("Download failed for rank %d (%s)", rank, winner["postlink"])
+            return None
+
+    logging.info("Create numbered image %s from %s", rank, winner["postlink"])
+    numbered_photo = await create_numbered_photo(media, rank, color, executor)
+    if not numbered_photo:
+        logging.error("Create numbered photo failed for rank %d (%s)", rank, winner["postlink"])
+        return None
+
+    store_cached_media(numbered_key, numbered_photo)
+    return numbered_photo
+
+def load_cached_media(key, name):
+    """Return media from MEDIA_CACHE as named BytesIO or None"""
+    if not config.MEDIA_CACHE:
+        return None
+
+    data = media_cache.read(config.MEDIA_CACHE, key)
+    if data is None:
+        return None
+
+    media = io.BytesIO(data)
+    media.name = name
     return media
 
-def save_image_as_png(photo, number):
-    '''Save image as png'''
-    result = False
-
-    if not os.path.exists('images'):
-        os.makedirs('images')
-
-    image = Image.open(photo)
+def store_cached_media(key, media):
+    """Keep media in MEDIA_CACHE"""
+    if config.MEDIA_CACHE:
+        media_cache.write(config.MEDIA_CACHE, key, media.getvalue())
 
-    # scale image down
-    maxsize = (500, 500)
-    image.thumbnail(maxsize)
+async def download_media(photo_id, unique_id = None):
+    """
+    Download media or read it from MEDIA_CACHE by unique id,
+    retry with exponential backoff and jitter
+    within DOWNLOAD_MEDIA_BUDGET seconds, return False on failure
+    """
+    if unique_id:
+        media = load_cached_media(("original", unique_id), f"{unique_id}.jpg")
+        if media:
+            return media
 
-    img_name = 'images/image_' + str(number) + '_temp.png'
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.DOWNLOAD_MEDIA_BUDGET
 
-    image.save(img_name, "PNG")
+    attempt = 0
+    while True:
+        try:
+            media = await app.download_media(photo_id, in_memory=True)
+            if media:
+                if unique_id:
+                    store_cached_media(("original", unique_id), media)
+                return media
+            delay = min(60, 2 ** (attempt + 1))
+            delay = random.uniform(delay / 2, delay)
+        except FloodWait as ex_flood:
+            delay = ex_flood.value
+        except (RPCError, OSError, asyncio.TimeoutError) as ex_download:
+            logging.warning("Download media %s failed: %s", photo_id, ex_download)
+            delay = min(60, 2 ** (attempt + 1))
+            delay = random.uniform(delay / 2, delay)
+
+        attempt += 1
+        if loop.time() + delay > deadline:
+            break
 
-    if os.path.exists(img_name):
-        result = img_name
+        # wait some time and retry download
+        logging.warning("Retry download media %s (%d), sleep %.1fs ...",
+            photo_id, attempt, delay)
+        await asyncio.sleep(delay)
 
-    return result
+    logging.error("Download media failed with %s after %d attempts", photo_id, attempt)
+    return False
 
-def create_numbered_photo(photo, number, color):
-    '''Returns path to the manipulated numbered photo as 500px thumbnail'''
+async def create_numbered_photo(photo, number, color, executor = None):
+    '''Render the numbered photo in executor, return PNG thumbnail in memory'''
     if not photo:
         return False
 
-    # save image as png for transparency
-    img_temp_name = save_image_as_png(photo, number)
-    if not img_temp_name:
+    loop = asyncio.get_running_loop()
+    try:
+        png_data = await loop.run_in_executor(executor,
+            poll_images.render_numbered_photo, photo.getvalue(), number, tuple(color[:3]))
+    except (OSError, ValueError) as ex_render:
+        logging.error("Render numbered photo %d failed: %s", number, ex_render)
         return False
 
-    image = Image.open(img_temp_name).convert("RGBA")
-
-    # Create text layer
-    txt = Image.new('RGBA', image.size, (255, 255, 255, 0))
+    numbered_photo = io.BytesIO(png_data)
+    numbered_photo.name = f"image_{number}.png"
 
-    # get image size
-    width, height = image.size
-
-    # create a draw object from image
-    draw = ImageDraw.Draw(txt)
-
-    # define the font
-    if os.name == 'nt':
-        font = ImageFont.truetype('arialbd.ttf', 136)
-    else:
-        font = ImageFont.truetype('DejaVuSans-Bold.ttf', 136)
-
-    # draw the number
-    draw.text(
-        (width/2, height/2),
-        str(number),
-        align="center",
-        font=font,
-        fill=(color[0], color[1], color[2], 120),
-        stroke_width=3,
-        stroke_fill=(0, 0, 0, 255),
-        anchor="mm"
-    )
-    # combine image and text
-    combined = Image.alpha_composite(image, txt)
-
-    # save the new numbered image
-    img_name = 'images/image_' + str(number) + '.png'
-    combined.save(img_name, "PNG")
-    logging.info("Image saved as '%s'", img_name)
-
-    return img_name
+    return numbered_photo
 
 async def send_ranking_message(final_message, winner):
     """verify and send ranking message"""
@@ -1687,7 +1919,7 @@ async def send_ranking_message(final_message, winner):
             )
 
         elif winner['photo'] != "" and not config.POST_WINNER_PHOTO:
-            await app.send_message(config.FINAL_MESSAGE_CHAT_ID, final_message,
+            await outbound.call("send_message", config.FINAL_MESSAGE_CHAT_ID, final_message,
                     parse_mode=enums.ParseMode.MARKDOWN)
 
         else:
@@ -1696,28 +1928,76 @@ async def send_ranking_message(final_message, winner):
             logging.warning(log_msg)
 
     if config.CONTEST_HIGHSCORE:
-        await update_highscore(winner['display_name'])
+        await update_highscore([winner['display_name']])
 
 ###########################
 # CSV based ranking methods
 ###########################
 
-def create_participant_from_csv(csv_row):
+def create_participant_from_csv(csv_row, csv_time = None):
     """Create a participant dict from CSV data"""
+    if csv_time is None:
+        csv_time = timestamps.parse_datetime(csv_row["Timestamp"])
+
     participant = {
         "author": csv_row["Username"],
         "postlink": csv_row["Postlink"],
-        "date": str(csv_row["Timestamp"]),
+        "date": csv_time,
         "count": int(csv_row["Count"]),
         "views": int(csv_row["Views"])
     }
 
     return participant
 
-def get_participants_from_csv(contest_days = config.CONTEST_DAYS):
-    """Collect participants from CSV file"""
-    csv_participants = []
+def load_contest_columns():
+    """Return contest columns, import CSV_FILE if it changed, empty without CSV_FILE"""
+    csv_size = -1
+    if os.path.isfile(config.CSV_FILE):
+        csv_size = os.path.getsize(config.CSV_FILE)
+
+    if os.path.isfile(config.CONTEST_COLUMNS_FILE):
+        columns_data = contest_columns.load(config.CONTEST_COLUMNS_FILE)
+        if csv_size in (-1, columns_data.csv_size):
+            return columns_data
+
+    if csv_size == -1:
+        return contest_columns.ContestColumns()
+
+    logging.info("Import %s to %s", config.CSV_FILE, config.CONTEST_COLUMNS_FILE)
+    columns_data = contest_columns.import_csv(config.CSV_FILE)
+    contest_columns.save(columns_data, config.CONTEST_COLUMNS_FILE)
+
+    return columns_data
+
+def get_rows_from_csv(contest_days):
+    """Return CSV rows in timeframe with parsed timestamps and the count of all rows"""
     contest_time = build_strptime(config.CONTEST_DATE)
+    csv_rows = []
+
+    if config.CONTEST_COLUMNS_FILE:
+        columns_data = load_contest_columns()
+        if columns_data:
+            window_start = contest_time - timedelta(days=contest_days)
+            for i in columns_data.select(window_start, contest_time):
+                csv_row = columns_data.row(i)
+                csv_rows.append((csv_row, csv_row['Timestamp']))
+            return csv_rows, len(columns_data)
+
+    if config.CSV_INDEX:
+        # only read blocks of the CSV in timeframe
+        index = csv_index.open_index(
+            csv_index.get_index_path(config.CSV_FILE, config.CSV_INDEX))
+        csv_index.update_index(index, config.CSV_FILE)
+        window_start = contest_time - timedelta(days=contest_days)
+
+        for row in csv_index.read_rows(index, config.CSV_FILE, window_start, contest_time):
+            row_time = timestamps.parse_datetime(row['Timestamp'])
+            if window_start < row_time <= contest_time:
+                csv_rows.append((row, row_time))
+
+        i = csv_index.count_rows(index)
+        index.close()
+        return csv_rows, i
 
     with open(config.CSV_FILE, mode='r', encoding="utf-8") as csvfile_single:
         csv_dict = csv.DictReader(csvfile_single)
@@ -1730,49 +2010,69 @@ def get_participants_from_csv(contest_days = config.CONTEST_DAYS):
 
             i += 1
             # check if row was in desired timeframe
-            row_time = build_strptime(str(row['Timestamp']))
+            row_time = timestamps.parse_datetime(row['Timestamp'])
             row_difftime = contest_time - row_time
 
             if ( row_difftime.days < contest_days
                     and not row_difftime.days < 0 ):
+                csv_rows.append((row, row_time))
 
-                duplicate = False
+    return csv_rows, i
 
-                # check if winner was already found
-                for participant in csv_participants:
+def get_participants_from_csv(contest_days = None):
+    """Collect participants from CSV file"""
+    if contest_days is None:
+        contest_days = config.CONTEST_DAYS
 
-                    if config.RANK_MEMES:
-                        if row['Postlink'] == participant["postlink"]:
-                            duplicate = True
-                    else:
-                        # check if User already found and add stats
-                        if row['Username'].lower() == participant["author"].lower():
-                            duplicate = True
-                            participant["count"] += int(row['Count'])
-                            participant["views"] += int(row['Views'])
-
-                            participant_time = build_strptime(str(participant["date"]))
-                            if participant_time < row_time:
-                                participant["date"] = row['Timestamp']
-
-                if not duplicate:
-                    # add participant to array
-                    csv_participant = create_participant_from_csv(row)
-                    csv_participants.append(csv_participant)
-
-        if i > 0:
-            logging.info("Read %d rows from %s", i, config.CSV_FILE)
+    # participant key to participant
+    csv_participants = {}
+
+    csv_rows, i = get_rows_from_csv(contest_days)
+    for row, row_time in csv_rows:
+
+        # memes are unique by postlink, authors by lowercase name
+        if config.RANK_MEMES:
+            participant_key = row['Postlink']
         else:
-            logging.error("Can not find CSV Data in %s", config.CSV_FILE)
-            sys.exit()
+            participant_key = row['Username'].lower()
+
+        participant = csv_participants.get(participant_key)
+        if participant is None:
+            # add participant to array
+            csv_participants[participant_key] = create_participant_from_csv(row, row_time)
+
+        elif not config.RANK_MEMES:
+            # User already found, add stats
+            participant["count"] += int(row['Count'])
+            participant["views"] += int(row['Views'])
 
-    return csv_participants
+            if participant["date"] < row_time:
+                participant["date"] = row_time
+
+    if i > 0:
+        logging.info("Read %d rows from %s", i, config.CSV_FILE)
+    else:
+        logging.error("Can not find CSV Data in %s", config.CSV_FILE)
+        sys.exit()
+
+    return list(csv_participants.values())
 
 def get_unique_ids_from_csv():
     """Collect unique file ids from CSV file"""
     csv_unique_ids = []
 
-    if os.path.isfile(config.CSV_FILE):
+    columns_data = None
+    if config.CONTEST_COLUMNS_FILE:
+        columns_data = load_contest_columns()
+
+    if columns_data:
+        for i, unique_id in enumerate(columns_data.unique_ids):
+            if unique_id:
+                csv_unique_ids.append([columns_data.postlink(i), unique_id])
+        logging.info("Load %d unique IDs from %s",
+            len(csv_unique_ids), config.CONTEST_COLUMNS_FILE)
+
+    elif os.path.isfile(config.CSV_FILE):
 
         with open(config.CSV_FILE, mode='r', encoding="utf-8") as csvfile_single:
 
@@ -1808,8 +2108,7 @@ def get_inactivities_from_csv():
     good_participants = []
 
     for participant in csv_participants:
-        participant_time = build_strptime(str(participant['date']))
-        participant_difftime = contest_time - participant_time
+        participant_difftime = contest_time - participant['date']
 
         duplicate = False
         for good_participant in good_participants:
@@ -1852,15 +2151,95 @@ def get_inactivities_from_csv():
 
 async def get_message_from_postlink(postlink):
     """return message from postlink"""
-    message = False
-    msg_id = get_message_id_from_postlink(postlink)
-    chat_id = get_chat_id_from_postlink(postlink)
-    if chat_id and msg_id:
-        message = await app.get_messages(chat_id, msg_id)
-    else:
-        logging.error("Cant find message from postlink: %s", postlink)
+    messages = await get_messages_from_postlinks([postlink])
+    return messages[postlink]
+
+async def get_messages_from_postlinks(postlinks):
+    """
+    Return dict of postlink and message, fetched with one
+    get_messages call per chat and 200 message ids
+    """
+    messages = {}
+    chat_message_ids = {}
+    for postlink in postlinks:
+        messages[postlink] = False
+        msg_id = get_message_id_from_postlink(postlink)
+        chat_id = get_chat_id_from_postlink(postlink)
+        if chat_id and msg_id:
+            chat_message_ids.setdefault(chat_id, {}).setdefault(msg_id, []).append(postlink)
+        else:
+            logging.error("Cant find message from postlink: %s", postlink)
+
+    for chat_id, message_ids in chat_message_ids.items():
+        chat_messages = await message_cache.get_messages(chat_id, list(message_ids))
+        for message, chat_postlinks in zip(chat_messages, message_ids.values()):
+            for postlink in chat_postlinks:
+                messages[postlink] = message
+
+    return messages
+
+class MessageCache:
+    """
+    Run scoped cache of messages by chat and message id,
+    concurrent requests of the same message share one fetch
+    """
+
+    def __init__(self):
+        self.messages = {}
+
+    async def get_messages(self, chat_id, message_ids):
+        """Return messages in order, fetch missing ones with up to 200 ids per call"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        missing = {}
+        for message_id in message_ids:
+            key = (chat_id, message_id)
+            if key not in self.messages:
+                self.messages[key] = loop.create_future()
+                missing[message_id] = self.messages[key]
+            futures.append(self.messages[key])
+
+        missing_ids = list(missing)
+        try:
+            for i in range(0, len(missing_ids), 200):
+                chunk = missing_ids[i:i+200]
+                chunk_messages = await app.get_messages(chat_id, chunk)
+                for message_id, message in zip(chunk, chunk_messages):
+                    missing[message_id].set_result(message)
+        except BaseException as ex_fetch:
+            self.fail(chat_id, missing, ex_fetch)
+            raise
+
+        # a short result leaves messages without answer
+        self.fail(chat_id, missing, LookupError(f"Messages of chat {chat_id} not returned"))
+
+        return [await future for future in futures]
+
+    def fail(self, chat_id, futures, error):
+        """Fail and forget unresolved futures by message id, the next call fetches again"""
+        for message_id, future in futures.items():
+            if future.done():
+                continue
+            if self.messages.get((chat_id, message_id)) is future:
+                del self.messages[(chat_id, message_id)]
+            if isinstance(error, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(error)
+                # the caller raises error, waiting callers still get it
+                future.exception()
+
+    def update(self, chat_id, message_id, message):
+        """Remember an edited message"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(message)
+        self.messages[(chat_id, message_id)] = future
+
+    def discard(self, chat_id, message_id):
+        """Forget a message, the next call fetches it again"""
+        self.messages.pop((chat_id, message_id), None)
 
-    return message
+message_cache = MessageCache()
 
 async def get_photo_id_from_postlink(postlink):
     """return photo id from CSV data or from chat history"""
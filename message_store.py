@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+"""
+Local SQLite store for photo and poll messages of a chat.
+Chat scans read the contest window from here and only
+fetch new or unsettled messages from telegram.
+"""
+
+import json
+import sqlite3
+from types import SimpleNamespace
+
+# own modules
+import timestamps
+
+# only these message types are kept in the store
+STORED_MEDIA = ["MessageMediaType.PHOTO", "MessageMediaType.POLL"]
+
+COLUMNS = [
+    "chat_key",
+    "id",
+    "chat_id",
+    "date",
+    "media",
+    "caption",
+    "text",
+    "entities",
+    "caption_entities",
+    "photo_id",
+    "unique_id",
+    "reactions",
+    "views",
+    "from_user_id",
+    "author_signature",
+    "media_group_id",
+    "reply_to_message_id",
+    "forward_from_message_id",
+    "poll",
+    "synced"
+]
+
+def open_store(path):
+    """Open or create the message store"""
+    store = sqlite3.connect(path)
+    store.row_factory = sqlite3.Row
+    store.execute(
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "chat_key TEXT, id INTEGER, chat_id INTEGER, date INTEGER, "
+        "media TEXT, caption TEXT, text TEXT, entities TEXT, caption_entities TEXT, "
+        "photo_id TEXT, unique_id TEXT, reactions TEXT, views INTEGER, "
+        "from_user_id INTEGER, author_signature TEXT, media_group_id TEXT, "
+        "reply_to_message_id INTEGER, forward_from_message_id INTEGER, "
+        "poll TEXT, synced INTEGER, "
+        "PRIMARY KEY (chat_key, id))"
+    )
+    store.execute(
+        "CREATE INDEX IF NOT EXISTS messages_date ON messages (chat_key, date)"
+    )
+    store.execute(
+        "CREATE TABLE IF NOT EXISTS sync_state ("
+        "chat_key TEXT PRIMARY KEY, newest_id INTEGER, newest_date INTEGER, "
+        "oldest_id INTEGER, oldest_date INTEGER)"
+    )
+    return store
+
+def entities_to_list(entities):
+    """Return message entities as list of dicts"""
+    if not entities:
+        return None
+
+    return [
+        {
+            "type": str(getattr(entity, "type", "")),
+            "offset": entity.offset,
+            "length": entity.length,
+            "url": getattr(entity, "url", None)
+        }
+        for entity in entities
+    ]
+
+def message_to_row(message, synced = None):
+    """Return a storable row dict from message object"""
+    row = dict.fromkeys(COLUMNS)
+    row["id"] = message.id
+    row["chat_id"] = message.chat.id if getattr(message, "chat", None) else None
+    row["date"] = timestamps.to_timestamp(message.date)
+    row["media"] = str(message.media) if getattr(message, "media", None) else None
+    row["synced"] = timestamps.to_timestamp(synced) if synced else None
+
+    for field in ["caption", "text"]:
+        if getattr(message, field, None) is not None:
+            row[field] = str(getattr(message, field))
+
+    for field in ["entities", "caption_entities"]:
+        entities = entities_to_list(getattr(message, field, None))
+        if entities:
+            row[field] = json.dumps(entities)
+
+    if getattr(message, "photo", None):
+        row["photo_id"] = message.photo.file_id
+        row["unique_id"] = message.photo.file_unique_id
+
+    reactions = getattr(getattr(message, "reactions", None), "reactions", None)
+    if reactions:
+        row["reactions"] = json.dumps(
+            [[reaction.emoji, reaction.count] for reaction in reactions]
+        )
+
+    row["views"] = getattr(message, "views", None)
+    if getattr(message, "from_user", None):
+        row["from_user_id"] = message.from_user.id
+
+    for field in ["author_signature", "media_group_id",
+            "reply_to_message_id", "forward_from_message_id"]:
+        row[field] = getattr(message, field, None)
+
+    if getattr(message, "poll", None):
+        row["poll"] = json.dumps({
+            "question": str(message.poll.question),
+            "is_closed": bool(message.poll.is_closed),
+            "options": [
+                [str(option.text), option.voter_count]
+                for option in (message.poll.options or [])
+            ]
+        })
+
+    return row
+
+def row_to_message(row):
+    """Return a lightweight message object from stored row"""
+    row = dict(row)
+
+    message = SimpleNamespace(
+        id=row["id"],
+        empty=False,
+        chat=SimpleNamespace(id=row["chat_id"]),
+        date=timestamps.from_timestamp(row["date"]),
+        media=row["media"],
+        caption=row["caption"],
+        text=row["text"],
+        entities=None,
+        caption_entities=None,
+        photo=None,
+        reactions=None,
+        views=row["views"],
+        from_user=None,
+        author_signature=row["author_signature"],
+        media_group_id=row["media_group_id"],
+        reply_to_message_id=row["reply_to_message_id"],
+        forward_from_message_id=row["forward_from_message_id"],
+        poll=None
+    )
+
+    for field in ["entities", "caption_entities"]:
+        if row[field]:
+            setattr(message, field, [
+                SimpleNamespace(**entity) for entity in json.loads(row[field])
+            ])
+
+    if row["photo_id"]:
+        message.photo = SimpleNamespace(
+            file_id=row["photo_id"],
+            file_unique_id=row["unique_id"]
+        )
+
+    if row["reactions"]:
+        message.reactions = SimpleNamespace(reactions=[
+            SimpleNamespace(emoji=emoji, count=count)
+            for emoji, count in json.loads(row["reactions"])
+        ])
+
+    if row["from_user_id"] is not None:
+        message.from_user = SimpleNamespace(id=row["from_user_id"])
+
+    if row["poll"]:
+        poll = json.loads(row["poll"])
+        message.poll = SimpleNamespace(
+            question=poll["question"],
+            is_closed=poll["is_closed"],
+            options=[
+                SimpleNamespace(text=text, voter_count=voter_count)
+                for text, voter_count in poll["options"]
+            ]
+        )
+
+    return message
+
+def save_messages(store, chat_key, messages, synced):
+    """Insert or update photo and poll messages, return stored count"""
+    rows = []
+    for message in messages:
+        if str(getattr(message, "media", None)) not in STORED_MEDIA:
+            continue
+        row = message_to_row(message, synced)
+        row["chat_key"] = chat_key
+        rows.append(row)
+
+    if rows:
+        store.executemany(
+            f"INSERT OR REPLACE INTO messages ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join(':' + column for column in COLUMNS)})",
+            rows
+        )
+        store.commit()
+
+    return len(rows)
+
+def delete_messages(store, chat_key, message_ids):
+    """Remove deleted messages from store"""
+    store.executemany(
+        "DELETE FROM messages WHERE chat_key = ? AND id = ?",
+        [(chat_key, message_id) for message_id in message_ids]
+    )
+    store.commit()
+
+def load_messages(store, chat_key, start, end):
+    """Return stored messages newer than start and not newer than end, newest first"""
+    rows = store.execute(
+        "SELECT * FROM messages WHERE chat_key = ? AND date > ? AND date <= ? "
+        "ORDER BY id DESC",
+        (chat_key, timestamps.to_timestamp(start), timestamps.to_timestamp(end))
+    )
+    return [row_to_message(row) for row in rows]
+
+def get_unsettled_ids(store, chat_key, start, end, settle_days, synced_before):
+    """Return ids of messages in timeframe, last synced while reactions could change"""
+    rows = store.execute(
+        "SELECT id FROM messages WHERE chat_key = ? AND date > ? AND date <= ? "
+        "AND synced < ? AND synced - date < ? ORDER BY id DESC",
+        (
+            chat_key,
+            timestamps.to_timestamp(start),
+            timestamps.to_timestamp(end),
+            timestamps.to_timestamp(synced_before),
+            settle_days * 86400
+        )
+    )
+    return [row["id"] for row in rows]
+
+def get_sync_state(store, chat_key):
+    """Return the synced id and date range of a chat or False"""
+    row = store.execute(
+        "SELECT * FROM sync_state WHERE chat_key = ?", (chat_key,)
+    ).fetchone()
+
+    if not row:
+        return False
+
+    return dict(row)
+
+def set_sync_state(store, chat_key, state):
+    """Remember the synced id and date range of a chat"""
+    store.execute(
+        "INSERT OR REPLACE INTO sync_state "
+        "(chat_key, newest_id, newest_date, oldest_id, oldest_date) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            chat_key,
+            state["newest_id"],
+            state["newest_date"],
+            state["oldest_id"],
+            state["oldest_date"]
+        )
+    )
+    store.commit()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Render numbered poll images.
+Only depends on PIL, so rendering can run in worker processes.
+"""
+
+import io
+import os
+import functools
+
+# image manipulation api
+from PIL import Image, ImageDraw, ImageFont
+
+# max width and height of numbered photos
+THUMBNAIL_SIZE = 500
+
+# size of the cached number layer
+NUMBER_LAYER_SIZE = 400
+
+@functools.lru_cache(maxsize=1)
+def get_number_font():
+    """Return the font for numbered photos, loaded once"""
+    if os.name == 'nt':
+        return ImageFont.truetype('arialbd.ttf', 136)
+    return ImageFont.truetype('DejaVuSans-Bold.ttf', 136)
+
+@functools.lru_cache(maxsize=64)
+def get_number_layer(number, color, odd_width, odd_height):
+    """
+    Return a transparent layer with the number drawn in the center,
+    odd sizes keep the same subpixel position as on the photo
+    """
+    size = (NUMBER_LAYER_SIZE + odd_width, NUMBER_LAYER_SIZE + odd_height)
+    layer = Image.new('RGBA', size, (255, 255, 255, 0))
+
+    # draw the number
+    draw = ImageDraw.Draw(layer)
+    draw.text(
+        (size[0]/2, size[1]/2),
+        str(number),
+        align="center",
+        font=get_number_font(),
+        fill=(color[0], color[1], color[2], 120),
+        stroke_width=3,
+        stroke_fill=(0, 0, 0, 255),
+        anchor="mm"
+    )
+
+    return layer
+
+def render_numbered_photo(photo_data, number, color):
+    '''Return the numbered photo as 500px PNG thumbnail bytes'''
+    image = Image.open(io.BytesIO(photo_data))
+
+    # scale image down
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    image = image.convert("RGBA")
+
+    # get image size
+    width, height = image.size
+    layer = get_number_layer(number, tuple(color), width % 2, height % 2)
+
+    # combine image and the centered number layer, cropped to the image
+    left = int(width/2) - int(layer.width/2)
+    top = int(height/2) - int(layer.height/2)
+    image.alpha_composite(
+        layer,
+        dest=(max(0, left), max(0, top)),
+        source=(
+            max(0, -left),
+            max(0, -top),
+            min(layer.width, width - left),
+            min(layer.height, height - top)
+        )
+    )
+
+    # encode the numbered image for upload
+    numbered_photo = io.BytesIO()
+    image.save(numbered_photo, "PNG")
+
+    return numbered_photo.getvalue()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+"""
+Record and replay telegram client calls.
+RecordingClient wraps a pyrogram Client and writes all messages,
+polls and media read by a run to a fixture file.
+ReplayClient replays this fixture offline and logs outbound calls.
+"""
+
+import io
+import gzip
+import json
+import base64
+import asyncio
+import logging
+from types import SimpleNamespace
+
+# own modules
+import message_store
+
+FIXTURE_VERSION = 1
+
+def load_fixture(path):
+    """Read a gzip compressed JSON fixture"""
+    with gzip.open(path, mode="rt", encoding="utf-8") as fixture_file:
+        fixture = json.load(fixture_file)
+
+    if fixture.get("version") != FIXTURE_VERSION:
+        logging.warning("Fixture version %s is unknown (%s)", fixture.get("version"), path)
+
+    return fixture
+
+def save_fixture(path, fixture):
+    """Write a gzip compressed JSON fixture"""
+    fixture["version"] = FIXTURE_VERSION
+    with gzip.open(path, mode="wt", encoding="utf-8") as fixture_file:
+        json.dump(fixture, fixture_file, separators=(",", ":"))
+
+def new_fixture():
+    """Return an empty fixture"""
+    return {"version": FIXTURE_VERSION, "messages": {}, "history": {}, "polls": {}, "media": {}}
+
+def message_to_fixture(message):
+    """Return a fixture row from message object"""
+    if not message or getattr(message, "empty", False):
+        return {"id": getattr(message, "id", None), "empty": True}
+
+    return message_store.message_to_row(message)
+
+def fixture_to_message(row):
+    """Return message object from fixture row"""
+    if row.get("empty"):
+        return SimpleNamespace(id=row["id"], empty=True, media=None)
+
+    return message_store.row_to_message(row)
+
+def poll_to_fixture(poll):
+    """Return a fixture row from poll object"""
+    return {
+        "question": str(poll.question),
+        "is_closed": bool(poll.is_closed),
+        "options": [[str(option.text), option.voter_count] for option in poll.options]
+    }
+
+def describe(value):
+    """Return JSON friendly description of outbound call arguments"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): describe(item) for key, item in value.items()}
+    if isinstance(value, io.IOBase):
+        return f"<{type(value).__name__} {getattr(value, 'name', '')}>".replace(" >", ">")
+    if hasattr(value, "offset") and hasattr(value, "length"):
+        return message_store.entities_to_list([value])[0]
+    if hasattr(value, "media"):
+        return {
+            "type": type(value).__name__,
+            "media": describe(value.media),
+            "caption": describe(getattr(value, "caption", None))
+        }
+    return str(value)
+
+class RecordingClient:
+    """Wrap a pyrogram Client and record everything a run reads"""
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.fixture = new_fixture()
+        self.history_ids = {}
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def __aenter__(self):
+        await self.client.start()
+        return self
+
+    async def __aexit__(self, *args):
+        for chat_key, message_ids in self.history_ids.items():
+            self.fixture["history"][chat_key] = sorted(message_ids)
+        save_fixture(self.path, self.fixture)
+        logging.info("Record: fixture saved as %s", self.path)
+        await self.client.stop()
+
+    def run(self, coroutine):
+        """Run the coroutine with the wrapped client"""
+        return self.client.run(coroutine)
+
+    def remember(self, chat_id, message, history = False):
+        """Add message to fixture"""
+        row = message_to_fixture(message)
+        if row["id"] is None:
+            return
+
+        chat_key = str(chat_id)
+        self.fixture["messages"].setdefault(chat_key, {})[str(row["id"])] = row
+        if history:
+            self.history_ids.setdefault(chat_key, set()).add(row["id"])
+
+    async def get_chat_history(self, chat_id, *args, **kwargs):
+        """Record chat history messages"""
+        async for message in self.client.get_chat_history(chat_id, *args, **kwargs):
+            self.remember(chat_id, message, history = True)
+            yield message
+
+    async def search_messages(self, chat_id, *args, **kwargs):
+        """Record searched messages"""
+        async for message in self.client.search_messages(chat_id, *args, **kwargs):
+            self.remember(chat_id, message, history = True)
+            yield message
+
+    async def get_messages(self, chat_id, message_ids, *args, **kwargs):
+        """Record messages by id"""
+        messages = await self.client.get_messages(chat_id, message_ids, *args, **kwargs)
+        if isinstance(messages, list):
+            for message_id, message in zip(message_ids, messages):
+                if getattr(message, "empty", False):
+                    message.id = message_id
+                self.remember(chat_id, message)
+        else:
+            if getattr(messages, "empty", False):
+                messages.id = message_ids
+            self.remember(chat_id, messages)
+        return messages
+
+    async def stop_poll(self, chat_id, message_id, *args, **kwargs):
+        """Record the poll result"""
+        poll = await self.client.stop_poll(chat_id, message_id, *args, **kwargs)
+        self.fixture["polls"][f"{chat_id}/{message_id}"] = poll_to_fixture(poll)
+        return poll
+
+    async def download_media(self, message, *args, **kwargs):
+        """Record downloaded media"""
+        media = await self.client.download_media(message, *args, **kwargs)
+        if isinstance(media, io.BytesIO):
+            self.fixture["media"][str(message)] = base64.b64encode(
+                media.getvalue()
+            ).decode("ascii")
+        return media
+
+class ReplayClient:
+    """Replay a recorded fixture without a telegram connection"""
+
+    def __init__(self, path = None, fixture = None):
+        self.path = path
+        if fixture is None:
+            fixture = load_fixture(path)
+        self.fixture = fixture
+        self.outbound = []
+        self.next_message_id = 1 << 30
+
+        self.messages = {}
+        for chat_key, rows in fixture["messages"].items():
+            self.messages[chat_key] = {
+                int(message_id): fixture_to_message(row)
+                for message_id, row in rows.items()
+            }
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        if self.path:
+            output_path = self.path + ".out.json"
+            with open(output_path, mode="w", encoding="utf-8") as output_file:
+                json.dump(self.outbound, output_file, ensure_ascii=False, indent=1)
+            logging.info("Replay: %d outbound calls saved as %s",
+                len(self.outbound), output_path)
+
+    def run(self, coroutine):
+        """Run the coroutine in a new event loop"""
+        return asyncio.run(coroutine)
+
+    def history(self, chat_id):
+        """Return recorded history messages of chat, newest first"""
+        chat_key = str(chat_id)
+        messages = self.messages.get(chat_key, {})
+        message_ids = sorted(self.fixture["history"].get(chat_key, []), reverse = True)
+        return [messages[message_id] for message_id in message_ids]
+
+    async def get_chat_history(self, chat_id, limit = 0, offset = 0,
+            offset_id = 0, offset_date = None):
+        """Replay chat history from newest to oldest message"""
+        messages = self.history(chat_id)
+        if offset_id:
+            messages = [message for message in messages if message.id < offset_id]
+        if offset_date:
+            messages = [message for message in messages if message.date < offset_date]
+        messages = messages[offset:]
+        if limit:
+            messages = messages[:limit]
+
+        for message in messages:
+            yield message
+
+    async def search_messages(self, chat_id, query = "", offset = 0,
+            filter = None, limit = 0): # pylint: disable=redefined-builtin
+        """Replay server side search of media messages"""
+        media = {
+            "MessagesFilter.PHOTO": "MessageMediaType.PHOTO"
+        }.get(str(filter))
+
+        messages = [
+            message for message in self.history(chat_id)
+            if (not media or str(message.media) == media)
+                and query in str(message.caption or message.text or "")
+        ][offset:]
+        if limit:
+            messages = messages[:limit]
+
+        for message in messages:
+            yield message
+
+    async def get_messages(self, chat_id, message_ids, *_args, **_kwargs):
+        """Replay messages by id"""
+        chat_messages = self.messages.get(str(chat_id), {})
+
+        def find(message_id):
+            if message_id in chat_messages:
+                return chat_messages[message_id]
+            logging.warning("Replay: message %s/%s was not recorded", chat_id, message_id)
+            return SimpleNamespace(id=message_id, empty=True, media=None)
+
+        if isinstance(message_ids, list):
+            return [find(message_id) for message_id in message_ids]
+        return find(message_ids)
+
+    async def stop_poll(self, chat_id, message_id, *args, **kwargs):
+        """Replay the poll result"""
+        self.log_outbound("stop_poll", (chat_id, message_id) + args, kwargs)
+        poll = self.fixture["polls"].get(f"{chat_id}/{message_id}")
+        if not poll:
+            logging.warning("Replay: poll %s/%s was not recorded", chat_id, message_id)
+            return None
+
+        return SimpleNamespace(
+            question=poll["question"],
+            is_closed=True,
+            options=[
+                SimpleNamespace(text=text, voter_count=voter_count)
+                for text, voter_count in poll["options"]
+            ]
+        )
+
+    async def download_media(self, message, in_memory = False, **_kwargs):
+        """Replay downloaded media as BytesIO"""
+        media = self.fixture["media"].get(str(message))
+        if media is None:
+            logging.warning("Replay: media %s was not recorded", message)
+            return None
+
+        media = io.BytesIO(base64.b64decode(media))
+        media.name = f"{message}.jpg"
+        if not in_memory:
+            logging.warning("Replay: media is returned in memory only")
+        return media
+
+    def log_outbound(self, method, args, kwargs):
+        """Remember an outbound call"""
+        call = {"method": method, "args": describe(list(args)), "kwargs": describe(kwargs)}
+        self.outbound.append(call)
+        logging.info("Replay: %s %s", method, json.dumps(call["args"], ensure_ascii=False)[:200])
+
+    def fake_message(self, chat_id, **kwargs):
+        """Return a message object for an outbound call"""
+        self.next_message_id += 1
+        message = SimpleNamespace(
+            id=self.next_message_id,
+            empty=False,
+            chat=SimpleNamespace(id=chat_id),
+            text=None,
+            caption=None,
+            entities=None,
+            caption_entities=None,
+            media=None
+        )
+        for key, value in kwargs.items():
+            setattr(message, key, value)
+        self.messages.setdefault(str(chat_id), {})[message.id] = message
+        return message
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        """Log outbound text message"""
+        self.log_outbound("send_message", (chat_id, text) + args, kwargs)
+        return self.fake_message(chat_id, text=text)
+
+    async def send_photo(self, chat_id, photo, *args, **kwargs):
+        """Log outbound photo message"""
+        self.log_outbound("send_photo", (chat_id, photo) + args, kwargs)
+        caption = args[0] if args else kwargs.get("caption", "")
+        return self.fake_message(chat_id, caption=caption, media="MessageMediaType.PHOTO")
+
+    async def send_document(self, chat_id, document, *args, **kwargs):
+        """Log outbound document message"""
+        self.log_outbound("send_document", (chat_id, document) + args, kwargs)
+        return self.fake_message(chat_id, caption=kwargs.get("caption"),
+            media="MessageMediaType.DOCUMENT")
+
+    async def send_media_group(self, chat_id, media, *args, **kwargs):
+        """Log outbound media group"""
+        self.log_outbound("send_media_group", (chat_id, media) + args, kwargs)
+        return [
+            self.fake_message(chat_id, caption=getattr(item, "caption", None),
+                media="MessageMediaType.PHOTO")
+            for item in media
+        ]
+
+    async def send_poll(self, chat_id, question, options, *args, **kwargs):
+        """Log outbound poll"""
+        self.log_outbound("send_poll", (chat_id, question, options) + args, kwargs)
+        return self.fake_message(chat_id, media="MessageMediaType.POLL", poll=SimpleNamespace(
+            question=question,
+            is_closed=False,
+            options=[SimpleNamespace(text=option, voter_count=0) for option in options]
+        ))
+
+    async def edit_message_text(self, chat_id, message_id, text, *args, **kwargs):
+        """Log outbound message edit and update the replayed message"""
+        self.log_outbound("edit_message_text", (chat_id, message_id, text) + args, kwargs)
+        message = self.messages.get(str(chat_id), {}).get(message_id)
+        if not message:
+            return self.fake_message(chat_id, text=text, entities=kwargs.get("entities"))
+
+        if message.caption is not None:
+            message.caption = text
+            message.caption_entities = kwargs.get("entities")
+        else:
+            message.text = text
+            message.entities = kwargs.get("entities")
+        return message
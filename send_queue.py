@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Rate limited dispatcher for outbound telegram calls.
+Calls wait for a token of their chat and a global token,
+a FloodWait pauses the chat and all chats for the requested time
+and the call is retried.
+Calls to the same chat are sent in the order they were submitted.
+"""
+
+import asyncio
+import logging
+
+from pyrogram.errors import FloodWait
+
+# give up a call after x FloodWait errors
+MAX_FLOOD_RETRIES = 5
+
+class TokenBucket:
+    """Token bucket with rate tokens per second, pausable, rate 0 is unlimited"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = None
+        self.paused_until = 0.0
+
+    async def acquire(self):
+        """Wait for a token and take it"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity,
+                    self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if now < self.paused_until:
+                delay = self.paused_until - now
+            elif not self.rate or self.tokens >= 1:
+                self.tokens -= 1
+                return
+            else:
+                delay = (1 - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """Hand out no tokens for seconds"""
+        loop = asyncio.get_running_loop()
+        self.paused_until = max(self.paused_until, loop.time() + seconds)
+
+class SendQueue:
+    """Send telegram calls with per chat and global rate limits"""
+
+    def __init__(self, client, chat_rate, global_rate, concurrency):
+        self.client = client
+        self.chat_rate = chat_rate
+        self.concurrency = concurrency
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets = {}
+        self.chat_locks = {}
+        self.semaphore = None
+
+    async def call(self, method, chat_id, *args, **kwargs):
+        """
+        Call client method for chat_id after all earlier calls to this chat,
+        wait for rate limits and retry on FloodWait
+        """
+        if self.semaphore is None:
+            # create within the running event loop
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = self.chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate))
+        lock = self.chat_locks.setdefault(chat_id, asyncio.Lock())
+
+        async with lock:
+            attempt = 0
+            while True:
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                try:
+                    async with self.semaphore:
+                        return await getattr(self.client, method)(chat_id, *args, **kwargs)
+                except FloodWait as ex_flood:
+                    attempt += 1
+                    if attempt > MAX_FLOOD_RETRIES:
+                        raise
+                    logging.warning("%s to %s: wait %s seconds to send more (%d)...",
+                        method, chat_id, ex_flood.value, attempt)
+                    # telegram limits the whole account, not just this chat
+                    bucket.pause(ex_flood.value)
+                    self.global_bucket.pause(ex_flood.value)
@@ -27,6 +27,11 @@ def get_file_from_args(filetype):
                         help="path to file with your config", metavar="FILE")
     parser.add_argument("-a", "--auth", dest="authfile",
                         help="path to file with your authentication", metavar="FILE")
+    parser.add_argument("--record", dest="recordfile",
+                        help="record telegram data read by this run to a fixture file",
+                        metavar="FILE")
+    parser.add_argument("--replay", dest="replayfile",
+                        help="run offline from a recorded fixture file", metavar="FILE")
 
     # parse args and ignore unknown args
     args, _unknown = parser.parse_known_args()
@@ -48,6 +53,16 @@ def get_file_from_args(filetype):
             # default file
             file = "config_api.py"
 
+    elif filetype == "record":
+        file = args.recordfile or False
+
+    elif filetype == "replay":
+        if args.replayfile:
+            file = args.replayfile
+            if not path.exists(file):
+                logging.info("File not found: %s", file)
+                sys.exit()
+
     return file
 
 def add_path(file):
@@ -92,11 +107,21 @@ def load_config():
     config.CONTEST_POLL_RESULT          = getattr(config, 'CONTEST_POLL_RESULT', False)
     config.CONTEST_POLL_RESULT_RANKING  = getattr(config, 'CONTEST_POLL_RESULT_RANKING', False)
     config.CONTEST_POLL_COLOR           = getattr(config, 'CONTEST_POLL_COLOR', False)
+    config.CONTEST_POLL_DOWNLOADS       = getattr(config, 'CONTEST_POLL_DOWNLOADS', 4)
+    config.CONTEST_POLL_WORKERS         = getattr(config, 'CONTEST_POLL_WORKERS', 4)
+    config.DOWNLOAD_MEDIA_BUDGET        = getattr(config, 'DOWNLOAD_MEDIA_BUDGET', 300)
+    config.SEND_CHAT_RATE               = getattr(config, 'SEND_CHAT_RATE', 0)
+    config.SEND_GLOBAL_RATE             = getattr(config, 'SEND_GLOBAL_RATE', 0)
+    config.SEND_CONCURRENCY             = getattr(config, 'SEND_CONCURRENCY', 4)
+    config.MEDIA_CACHE                  = getattr(config, 'MEDIA_CACHE', False)
+    config.MEDIA_CACHE_SIZE             = getattr(config, 'MEDIA_CACHE_SIZE', 500)
     config.CONTEST_POLL_FROM_POLLS      = getattr(config, 'CONTEST_POLL_FROM_POLLS', False)
     config.CONTEST_POLL_PATTERN         = getattr(
         config, 'CONTEST_POLL_PATTERN', ["Meme of the week", "The Community has voted"]
     )
     config.CONTEST_HIGHSCORE            = getattr(config, 'CONTEST_HIGHSCORE', False)
+    config.CONTEST_HIGHSCORE_NEXT       = getattr(config, 'CONTEST_HIGHSCORE_NEXT', "➡️ More")
+    config.CONTEST_HIGHSCORE_LEDGER     = getattr(config, 'CONTEST_HIGHSCORE_LEDGER', False)
     config.EXCLUDE_PATTERN              = getattr(
         config, 'EXCLUDE_PATTERN', ["My funny Contest", "Ranking"]
     )
@@ -122,6 +147,11 @@ def load_config():
     config.PARTICIPANT_DUPLICATES       = getattr(config, 'PARTICIPANT_DUPLICATES', False)
     config.DATE_FORMATTING              = getattr(config, 'DATE_FORMATTING', "%d/%m/%Y")
     config.CONTEST_HASHTAGLIST          = getattr(config, 'CONTEST_HASHTAGLIST', False)
+    config.MESSAGE_STORE                = getattr(config, 'MESSAGE_STORE', False)
+    config.MESSAGE_STORE_SETTLE_DAYS    = getattr(config, 'MESSAGE_STORE_SETTLE_DAYS', 7)
+    config.SCAN_MEDIA_FILTER            = getattr(config, 'SCAN_MEDIA_FILTER', False)
+    config.CSV_INDEX                    = getattr(config, 'CSV_INDEX', False)
+    config.CONTEST_COLUMNS_FILE         = getattr(config, 'CONTEST_COLUMNS_FILE', False)
 
     return config
 
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+"""
+Timestamp helpers shared by the message store, CSV index and contest columns.
+Message dates are naive local datetimes, stored as wall clock seconds.
+"""
+
+from datetime import datetime, timedelta
+
+# wall clock epoch, message dates are naive local datetimes
+EPOCH = datetime(1970, 1, 1)
+
+def to_timestamp(date):
+    """Return wall clock seconds from naive datetime"""
+    return int((date - EPOCH).total_seconds())
+
+def from_timestamp(timestamp):
+    """Return naive datetime from wall clock seconds"""
+    return EPOCH + timedelta(seconds=timestamp)
+
+def parse_datetime(time_string):
+    """Return naive datetime from a stored time string like str(datetime)"""
+    try:
+        # fast path for the ISO format written by str(datetime)
+        return datetime.fromisoformat(time_string)
+    except ValueError:
+        return datetime.strptime(time_string, "%Y-%m-%d %H:%M:%S")